@@ -1,7 +1,24 @@
 import pygame
 import sys
+import os
 import math
 import random
+import time
+import json
+import hashlib
+import struct
+import mmap
+import marshal
+import multiprocessing
+import gc
+import tracemalloc
+from collections import OrderedDict, defaultdict
+import atexit
+import threading
+try:
+    import numpy as np
+except ImportError:  # enemies then update one by one
+    np = None
 from pygame.locals import *
 
 # Constants
@@ -9,7 +26,51 @@ SCALE = 2
 TILE = 16
 WIDTH = int(300 * SCALE)
 HEIGHT = int(240 * SCALE)
-FPS = 60
+FPS = 60  # render cap; 0 renders as fast as the display allows
+
+# Fixed-rate simulation: scenes always update in SIM_DT steps, whatever the render rate
+SIM_HZ = 60
+SIM_DT = 1 / SIM_HZ
+MAX_SIM_STEPS = 5  # catch-up limit after a hitch; older time is dropped
+PROFILER_KEY = K_F3  # toggles the frame profiler overlay
+SAMPLER_KEY = K_F4  # samples the game loop for SAMPLE_SECONDS into profile.folded
+SAMPLE_SECONDS = 10
+
+# Enemies step in one numpy pass over their EntityStore; False (or no numpy) updates them one by one
+BATCH_ENEMIES = True
+# Enemies are created once the camera comes within SPAWN_AHEAD of their column
+# and go back to the store's pool once DESPAWN_BEHIND past the left edge of the screen
+SPAWN_AHEAD = 4 * TILE
+DESPAWN_BEHIND = 8 * TILE
+# Enemies more than WAKE_MARGIN off screen sleep; with LOD_EVERY > 1, those more than LOD_MARGIN
+# off screen update only every LOD_EVERY steps, with a dt to match
+WAKE_MARGIN = 3 * TILE
+LOD_MARGIN = TILE
+LOD_EVERY = 1
+# Contact queries sort a sweep only from this many enemies up; below it scanning them all is cheaper
+SWEEP_MIN_ENEMIES = 16
+
+# Levels and thumbnails are made when first asked for; at most this many of each stay
+# in memory, and an evicted one is rebuilt if it is visited again
+LEVEL_CACHE_SIZE = 8
+THUMBNAIL_CACHE_SIZE = 8
+
+# Compiled levels are cached here, a directory per engine, in files named by the engine version
+# and a hash of the level, but only levels a later launch builds again: hand-built ones, and every
+# level once the seed is pinned (--seed, --level-pack); --compile-levels fills the cache ahead of time.
+# Files of other engine versions are deleted, and past LEVEL_CACHE_BYTES the least recently used go first
+LEVEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "level_cache", os.path.splitext(os.path.basename(__file__))[0])
+LEVEL_CACHE_BYTES = 64 * 2 ** 20
+
+# Baked tile layer: static tiles are pre-rendered into CHUNK_TILES-wide column strips
+BAKE_TILES = True
+CHUNK_TILES = 16
+BAKE_KEY = (255, 0, 255)
+ANIMATED_TILES = ("A",)
+# Animation frames / variants each tile char can be drawn with
+TILE_FRAMES = {"A": range(-3, 4)}
+# How far tile art may paint outside its own cell (pipe lips, flag)
+TILE_OVERHANG = TILE
 
 # NES Palette
 NES_PALETTE = [
@@ -47,16 +108,330 @@ class GameState:
 
 state = GameState()
 
+# Input: Player reads held keys from `controls`, live keyboard or a script
+class KeyboardInput:
+    """Live keyboard state"""
+    def __init__(self):
+        self.step = 0
+    def pressed(self):
+        return pygame.key.get_pressed()
+    def advance(self):
+        # Called once per simulation step
+        self.step += 1
+
+class HeldKeys:
+    """get_pressed()-style lookup over a set of held keys"""
+    def __init__(self, keys):
+        self.keys = frozenset(keys)
+    def __getitem__(self, key):
+        return key in self.keys
+
+class ScriptedInput(KeyboardInput):
+    """Held keys come from script(step) instead of the keyboard"""
+    def __init__(self, script):
+        super().__init__()
+        self.script = script
+    def pressed(self):
+        return HeldKeys(self.script(self.step))
+
+def run_right(step):
+    # Default headless script: run right, hopping every second
+    return (K_RIGHT, K_LSHIFT, K_SPACE) if step % 60 < 15 else (K_RIGHT, K_LSHIFT)
+
+controls = KeyboardInput()
+
+# Replays: held REPLAY_KEYS per simulation step as run-length encoded bitmasks
+REPLAY_KEYS = (K_LEFT, K_RIGHT, K_SPACE, K_LSHIFT, K_RSHIFT)
+
+def key_mask(keys):
+    return sum(1 << i for i, key in enumerate(REPLAY_KEYS) if keys[key])
+
+def mask_keys(mask):
+    return [key for i, key in enumerate(REPLAY_KEYS) if mask >> i & 1]
+
+def fold_digest(digest, scene):
+    # Running hash of the simulated player; equal digests mean frame-identical runs
+    if isinstance(scene, LevelScene):
+        digest.update(repr((scene.level_id, scene.player.x, scene.player.y, state.score, state.lives)).encode())
+
+class RecordingInput(KeyboardInput):
+    """Live keyboard, logged step by step until play leaves the levels"""
+    def __init__(self, level_id, seed):
+        super().__init__()
+        self.level_id = level_id
+        self.seed = seed
+        self.held = HeldKeys(())
+        self.runs = []  # [steps, mask] pairs
+        self.digest = hashlib.sha1()
+        self.done = False
+    def pressed(self):
+        self.held = pygame.key.get_pressed()
+        return self.held
+    def advance(self):
+        if not self.done:
+            if isinstance(SCENES[-1], LevelScene):
+                mask = key_mask(self.held)
+                if self.runs and self.runs[-1][1] == mask:
+                    self.runs[-1][0] += 1
+                else:
+                    self.runs.append([1, mask])
+                fold_digest(self.digest, SCENES[-1])
+            else:
+                self.done = True
+        super().advance()
+    def save(self, path):
+        replay = {"version": 1, "level": self.level_id, "seed": self.seed, "sim_hz": SIM_HZ,
+                  "frames": sum(n for n, _ in self.runs), "keys": self.runs, "digest": self.digest.hexdigest()}
+        with open(path, "w") as f:
+            json.dump(replay, f, separators=(",", ":"))
+
+class ReplayInput(ScriptedInput):
+    """Feeds a recorded session's keys back step by step"""
+    def __init__(self, replay):
+        masks = [mask for n, mask in replay["keys"] for _ in range(n)]
+        super().__init__(lambda step: mask_keys(masks[step]) if step < len(masks) else ())
+        self.digest = hashlib.sha1()
+    def advance(self):
+        fold_digest(self.digest, SCENES[-1])
+        super().advance()
+
 # Scene management
 SCENES = []
-def push(scene): SCENES.append(scene)
-def pop(): SCENES.pop()
+DISPOSED = []  # scenes taken off the stack this frame, released by collect_scenes()
+def push(scene):
+    if SCENES:
+        SCENES[-1].exit()
+    SCENES.append(scene)
+    scene.enter()
+def drop():
+    # Take the top scene off for good without waking the one below
+    scene = SCENES.pop()
+    scene.exit()
+    DISPOSED.append(scene)
+def pop():
+    drop()
+    if SCENES:
+        SCENES[-1].enter()
+def replace(scene):
+    # Swap the top scene instead of stacking on it (level -> next level)
+    if SCENES:
+        drop()
+    SCENES.append(scene)
+    scene.enter()
+def pop_to(cls):
+    # Unwind to the nearest scene of type cls, or start over from a new one if none is stacked
+    if not any(isinstance(s, cls) for s in SCENES):
+        reset_to(cls())
+        return
+    while not isinstance(SCENES[-1], cls):
+        drop()
+    SCENES[-1].enter()
+def reset_to(scene):
+    # Release the whole stack (game over -> title)
+    while SCENES:
+        drop()
+    SCENES.append(scene)
+    scene.enter()
+def collect_scenes():
+    # Deferred so a scene that triggers its own removal can still finish the frame
+    while DISPOSED:
+        DISPOSED.pop().dispose()
 
 class Scene:
+    def enter(self): ...    # became the top scene (pushed or uncovered)
+    def exit(self): ...     # stopped being the top scene (covered or removed)
+    def dispose(self): ...  # left the stack for good; drop whatever it holds
+    alpha = 1.0  # how far the frame being drawn is between the last two updates
     def handle(self, events, keys): ...
     def update(self, dt): ...
     def draw(self, surf): ...
 
+class TextCache:
+    """Shared font objects and rendered text surfaces for every scene"""
+    def __init__(self, max_surfaces=256):
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.max_surfaces = max_surfaces
+        self.hits = 0
+        self.misses = 0
+    def font(self, size, name=None):
+        font = self.fonts.get((name, size))
+        if font is None:
+            font = self.fonts[(name, size)] = pygame.font.SysFont(name, size)
+        return font
+    def render(self, text, size, color, antialias=True, name=None):
+        key = (text, size, color, antialias, name)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+        self.misses += 1
+        surf = self.surfaces[key] = self.font(size, name).render(text, antialias, color)
+        # Least recently used text goes first
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surf
+
+text_cache = TextCache()
+
+class FrameProfiler:
+    """Main-loop phase times in fixed-size ring buffers; an overlay shows them when toggled"""
+    PHASES = ("events", "handle", "update", "draw", "flip")
+    def __init__(self, size=240):
+        self.size = size
+        self.samples = {phase: [0.0] * size for phase in self.PHASES + ("frame",)}
+        self.index = 0
+        self.count = 0
+        self.visible = False
+        self.drawn = 0
+        self.lines = []
+        self.panel = None
+    def record(self, stamps):
+        # stamps: perf_counter() before the first phase and after each one. This is all
+        # that runs while the overlay is hidden: a few list stores per frame
+        i = self.index
+        for n, phase in enumerate(self.PHASES):
+            self.samples[phase][i] = stamps[n + 1] - stamps[n]
+        self.samples["frame"][i] = stamps[-1] - stamps[0]
+        self.index = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+    def percentile(self, phase, q):
+        ordered = sorted(self.samples[phase][:self.count])
+        return ordered[min(self.count - 1, int(q * self.count))] * 1000
+    def draw(self, surf):
+        if not self.visible or not self.count:
+            return
+        # Percentiles are re-sorted a few times a second, not every frame
+        if self.drawn % 15 == 0:
+            self.lines = [(phase, f"{self.percentile(phase, 0.5):.2f}", f"{self.percentile(phase, 0.99):.2f}")
+                          for phase in self.PHASES + ("frame",)]
+        self.drawn += 1
+        graph_h = 40
+        width, height = self.size + 8, 16 + len(self.lines) * 12 + graph_h + 8
+        if self.panel is None:
+            self.panel = pygame.Surface((width, height), SRCALPHA)
+            self.panel.fill((0, 0, 0, 170))
+        x, y = 4, HEIGHT - height - 4
+        surf.blit(self.panel, (x, y))
+        for n, row in enumerate([("phase", "p50 ms", "p99 ms")] + self.lines):
+            color = (255, 255, 255) if n == 0 else (200, 200, 200)
+            for col, text in zip((4, 80, 150), row):
+                surf.blit(text_cache.render(text, 14, color), (x + col, y + 4 + n * 12))
+        # Frame-time graph, oldest on the left; red bars went over one display frame
+        budget = 1 / FPS if FPS else SIM_DT
+        base = y + height - 4
+        frames = self.samples["frame"]
+        start = (self.index - self.count) % self.size
+        for n in range(self.count):
+            t = frames[(start + n) % self.size]
+            h = min(graph_h, int(t / budget * graph_h / 2))
+            color = (80, 220, 80) if t <= budget else (230, 60, 60)
+            pygame.draw.line(surf, color, (x + 4 + n, base), (x + 4 + n, base - h))
+        pygame.draw.line(surf, (255, 255, 255), (x + 4, base - graph_h // 2), (x + 4 + self.size, base - graph_h // 2))
+
+profiler = FrameProfiler()
+
+class Counters:
+    """Work done per frame by subsystem; engine code bumps them, the main loop rolls them over"""
+    PRIMITIVES = ("rect", "ellipse", "circle", "line", "lines", "polygon", "arc")
+    def __init__(self):
+        self.frame = defaultdict(int)
+        self.last = {}  # the previous frame's counts
+        self.totals = defaultdict(int)
+        self.frames = 0
+        self.originals = {}
+    def add(self, name, n=1):
+        self.frame[name] += n
+    def end_frame(self):
+        for name, n in self.frame.items():
+            self.totals[name] += n
+        self.last = dict(self.frame)
+        self.frame.clear()
+        self.frames += 1
+    def reset(self):
+        self.frame.clear()
+        self.totals.clear()
+        self.last = {}
+        self.frames = 0
+    def count_primitives(self, on=True):
+        # pygame.draw calls are spread over every paint routine, so they are counted by
+        # wrapping the module's functions while enabled rather than at each call site
+        for name in self.PRIMITIVES:
+            if on and name not in self.originals:
+                self.originals[name] = getattr(pygame.draw, name)
+                setattr(pygame.draw, name, self.counted(self.originals[name]))
+            elif not on and name in self.originals:
+                setattr(pygame.draw, name, self.originals.pop(name))
+    def counted(self, draw):
+        def call(*args, **kwargs):
+            self.frame["draw.primitives"] += 1
+            return draw(*args, **kwargs)
+        return call
+    def report(self):
+        frames = max(self.frames, 1)
+        return {name: {"total": n, "per_frame": round(n / frames, 2)} for name, n in sorted(self.totals.items())}
+    def dump(self, file=None):
+        print(f"counters over {self.frames} frames", file=file or sys.stderr)
+        for name, row in self.report().items():
+            print(f"  {name:<24}{row['total']:>12}{row['per_frame']:>12.2f} /frame", file=file or sys.stderr)
+
+counters = Counters()
+
+class SamplingProfiler:
+    """Samples the main thread's stack from a background thread; writes collapsed stacks"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.thread = None
+        self.until = 0
+        atexit.register(self.stop)  # once; stop() is a no-op when not sampling
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+    def start(self, seconds, path):
+        if self.running():
+            return
+        self.path = path
+        self.until = time.perf_counter() + seconds
+        self.stacks.clear()
+        self.target = threading.get_ident()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    def stop(self):
+        # Ends sampling early (e.g. the run finished first) and still writes what was taken
+        self.until = 0
+        if self.running():
+            self.thread.join()
+    def tag(self):
+        # Root of every stack: the scene on top when the sample was taken, plus its level
+        try:
+            scene = SCENES[-1]
+        except IndexError:
+            return "no scene"
+        level_id = getattr(scene, "level_id", None)
+        return f"{type(scene).__name__} {level_id}" if level_id else type(scene).__name__
+    def run(self):
+        while time.perf_counter() < self.until:
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join([self.tag()] + stack[::-1])] += 1
+            time.sleep(self.interval)
+        self.write()
+    def write(self):
+        # One "root;...;leaf count" line per distinct stack, as flamegraph.pl / speedscope read it
+        with open(self.path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"sampling profiler: {sum(self.stacks.values())} samples written to {self.path}", file=sys.stderr)
+
+sampler = SamplingProfiler()
+
 # World themes
 WORLD_THEMES = {
     1: {"sky": 27, "ground": 20, "pipe": 14, "block": 33, "water": None, "enemy": "E", "name": "GRASS LAND"},
@@ -69,6 +444,47 @@ WORLD_THEMES = {
     8: {"sky": 13, "ground": 0, "pipe": 14, "block": 0, "water": None, "enemy": "K", "name": "BOWSER'S CASTLE"}
 }
 
+# Castle art stamped at the end of generated levels
+CASTLE = ["   C", "   C", "  CCC", " CCCCC", "CCCCCCC"]
+
+class LevelBuilder:
+    """Level under construction as a mutable grid of tile chars; rows() exports the usual row strings"""
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.cells = bytearray(b" " * (width * height))
+    def put(self, x, y, char):
+        # One cell; anything outside the level is dropped
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.cells[y * self.width + x] = ord(char)
+    def fill(self, x, y, w, h, char):
+        # A w x h block of one char (" " digs gaps), clipped to the level
+        x0, x1 = max(x, 0), min(x + w, self.width)
+        if x0 >= x1:
+            return
+        run = char.encode() * (x1 - x0)
+        for row in range(max(y, 0), min(y + h, self.height)):
+            self.cells[row * self.width + x0:row * self.width + x1] = run
+    def stamp(self, x, y, pattern):
+        # Rows of chars with their top-left corner at (x, y); spaces leave what is underneath
+        for row, line in enumerate(pattern, y):
+            if 0 <= row < self.height:
+                start = row * self.width
+                for col, char in enumerate(line, x):
+                    if char != " " and 0 <= col < self.width:
+                        self.cells[start + col] = ord(char)
+    def pipe(self, x, bottom, height, top, body):
+        # Pipe whose lowest row is bottom: height rows, the first one the cap
+        self.stamp(x, bottom - height + 1, [top] + [body] * (height - 1))
+    def stairs(self, x, bottom, steps, char):
+        # Staircase rising to the right from row bottom, one tile higher per column
+        for step in range(steps):
+            self.fill(x + step, bottom - step, 1, step + 1, char)
+    def castle(self, x, bottom):
+        # CASTLE with its base on row bottom
+        self.stamp(x, bottom - len(CASTLE) + 1, CASTLE)
+    def rows(self):
+        return [self.cells[y * self.width:(y + 1) * self.width].decode("ascii") for y in range(self.height)]
+
 # Tile Characters:
 # '#' = Ground top
 # '=' = Brick
@@ -137,115 +553,263 @@ LEVEL_8_4 = [
     "####################################################################################################################################################                          bAAAAAAAAAAAAAAAAb        ",
 ]
 
-def generate_level_data():
-    levels = {}
+# Every level id, in play order
+LEVEL_IDS = [f"{world}-{level}" for world in range(1, 9) for level in range(1, 5)]
+
+def generate_level(seed, level_id):
+    # Each level draws from its own random stream, so any one can be built (or rebuilt) alone
+    # World 1-1 and 8-4 are accurate
+    if level_id == "1-1":
+        return LEVEL_1_1
+    if level_id == "8-4":
+        return LEVEL_8_4
+    world, level = map(int, level_id.split("-"))
+    rng = random.Random(f"{seed}-{level_id}")
+    theme = WORLD_THEMES[world]
+    # Sky rows 0-9, platform area 10-15, ground 16-19
+    builder = LevelBuilder(200, 20)
+    builder.fill(0, 16, 200, 4, "#")
     
-    # World 1-1 is accurate
-    levels["1-1"] = LEVEL_1_1
+    # Add platforms
+    for i in range(5 + level):
+        platform_y = rng.randint(8, 13)
+        platform_x = rng.randint(10 + i*20, 15 + i*20)
+        length = rng.randint(3, 6)
+        builder.fill(platform_x, platform_y, length, 1, "=")
     
-    # Generate other levels procedurally
-    for world in range(1, 9):
-        for level in range(1, 5):
-            level_id = f"{world}-{level}"
-            
-            # Skip 1-1 (already set) and 8-4 (set below)
-            if level_id == "1-1":
-                continue
-            if level_id == "8-4":
-                levels["8-4"] = LEVEL_8_4
-                continue
-                
-            theme = WORLD_THEMES[world]
-            level_data = []
-            
-            # Sky rows
-            for i in range(10):
-                level_data.append(" " * 200)
-            
-            # Platform area
-            for i in range(10, 16):
-                level_data.append(" " * 200)
-            
-            # Ground
-            for i in range(16, 20):
-                if i == 16:
-                    row = "#" * 200
-                else:
-                    row = "#" * 200
-                level_data.append(row)
-            
-            # Add platforms
-            for i in range(5 + level):
-                platform_y = random.randint(8, 13)
-                platform_x = random.randint(10 + i*20, 15 + i*20)
-                length = random.randint(3, 6)
-                for j in range(length):
-                    if platform_x + j < 200:
-                        level_data[platform_y] = level_data[platform_y][:platform_x+j] + "=" + level_data[platform_y][platform_x+j+1:]
-            
-            # Add pipes
-            for i in range(2 + level//2):
-                pipe_x = random.randint(20 + i*35, 30 + i*35)
-                if pipe_x < 195:
-                    pipe_height = random.randint(2, 4)
-                    # Pipe top
-                    level_data[15-pipe_height] = level_data[15-pipe_height][:pipe_x] + "TT" + level_data[15-pipe_height][pipe_x+2:]
-                    # Pipe body
-                    for j in range(pipe_height):
-                        level_data[16-pipe_height+j] = level_data[16-pipe_height+j][:pipe_x] + "tt" + level_data[16-pipe_height+j][pipe_x+2:]
-            
-            # Add ? blocks and bricks
-            for i in range(6 + level):
-                block_y = random.randint(8, 12)
-                block_x = random.randint(10 + i*15, 15 + i*15)
-                if block_x < 200:
-                    block_type = "?" if random.random() > 0.4 else "="
-                    level_data[block_y] = level_data[block_y][:block_x] + block_type + level_data[block_y][block_x+1:]
-            
-            # Add player start
-            level_data[15] = level_data[15][:3] + "S" + level_data[15][4:]
-            
-            # Add flag and castle at end
-            level_data[15] = level_data[15][:190] + "L" + level_data[15][191:]
-            level_data[11] = level_data[11][:194] + "C" + level_data[11][195:]
-            level_data[12] = level_data[12][:194] + "C" + level_data[12][195:]
-            level_data[13] = level_data[13][:193] + "CCC" + level_data[13][196:]
-            level_data[14] = level_data[14][:192] + "CCCCC" + level_data[14][197:]
-            level_data[15] = level_data[15][:191] + "CCCCCCC" + level_data[15][198:]
-            
-            # Add enemies
-            for i in range(4 + level):
-                enemy_y = 15
-                enemy_x = random.randint(25 + i*18, 35 + i*18)
-                if enemy_x < 185:
-                    enemy_type = theme["enemy"]
-                    level_data[enemy_y] = level_data[enemy_y][:enemy_x] + enemy_type + level_data[enemy_y][enemy_x+1:]
-            
-            levels[level_id] = level_data
+    # Add pipes
+    for i in range(2 + level//2):
+        pipe_x = rng.randint(20 + i*35, 30 + i*35)
+        if pipe_x < 195:
+            pipe_height = rng.randint(2, 4)
+            builder.pipe(pipe_x, 15, pipe_height + 1, "TT", "tt")
+    
+    # Add ? blocks and bricks
+    for i in range(6 + level):
+        block_y = rng.randint(8, 12)
+        block_x = rng.randint(10 + i*15, 15 + i*15)
+        if block_x < 200:
+            block_type = "?" if rng.random() > 0.4 else "="
+            builder.put(block_x, block_y, block_type)
+    
+    # Add player start
+    builder.put(3, 15, "S")
     
-    return levels
+    # Add flag and castle at end
+    builder.put(190, 15, "L")
+    builder.castle(191, 15)
+    
+    # Add enemies
+    for i in range(4 + level):
+        enemy_y = 15
+        enemy_x = rng.randint(25 + i*18, 35 + i*18)
+        if enemy_x < 185:
+            builder.put(enemy_x, enemy_y, theme["enemy"])
+    
+    return builder.rows()
+
+def generate_level_data(seed):
+    return {level_id: generate_level(seed, level_id) for level_id in LEVEL_IDS}
+
+class LevelCache:
+    """Level id -> value, made on first access; only the `size` most recently used are kept"""
+    def __init__(self, name, make, ids, size):
+        self.name = name
+        self.make = make
+        self.ids = list(ids)
+        self.size = size
+        self.cache = OrderedDict()
+        self.fixed = {}  # assigned values stand in for make() and are never evicted
+    def __getitem__(self, level_id):
+        if level_id in self.fixed:
+            return self.fixed[level_id]
+        if level_id in self.cache:
+            self.cache.move_to_end(level_id)
+            return self.cache[level_id]
+        if level_id not in self.ids:
+            raise KeyError(level_id)
+        value = self.cache[level_id] = self.make(level_id)
+        counters.add(f"{self.name}.made")
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+            counters.add(f"{self.name}.evicted")
+        return value
+    def __setitem__(self, level_id, value):
+        if level_id not in self.ids:
+            self.ids.append(level_id)
+        self.fixed[level_id] = value
+    def __contains__(self, level_id):
+        return level_id in self.ids
+    def __iter__(self):
+        return iter(self.ids)
+    def __len__(self):
+        return len(self.ids)
+    def keys(self):
+        return list(self.ids)
+    def get(self, level_id, default=None):
+        return self[level_id] if level_id in self.ids else default
+    def update(self, levels):
+        for level_id in levels:
+            self[level_id] = levels[level_id]
+    def clear(self):
+        # Drop made and assigned values; the ids stay, so the next access makes them afresh
+        self.cache.clear()
+        self.fixed.clear()
+
+# Level pack: a header, one fixed-size entry per (seed, level id), then the tile grids.
+# Tile ids are the level's ASCII tile chars, with 0 padding rows shorter than the widest.
+LEVEL_PACK_MAGIC = b"KLVP"
+LEVEL_PACK_VERSION = 1
+LEVEL_PACK_HEADER = struct.Struct("<4sHI")  # magic, version, entry count
+LEVEL_PACK_ENTRY = struct.Struct("<8sHHBIBQI")  # id, width, height, theme, seed, encoding, offset, size
+PACK_RAW, PACK_RLE = 0, 1
+
+def rle_encode(cells):
+    # (run length, tile id) byte pairs; a row of sky is a single pair
+    if np is not None and cells:
+        tiles = np.frombuffer(cells, np.uint8)
+        starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]])
+        lengths = np.diff(np.r_[starts, tiles.size])
+        # Runs longer than 255 become several pairs, full ones first
+        pieces = (lengths + 254) // 255
+        counts = np.full(pieces.sum(), 255)
+        counts[np.cumsum(pieces) - 1] = lengths - 255 * (pieces - 1)
+        return np.column_stack((counts, np.repeat(tiles[starts], pieces))).astype(np.uint8).tobytes()
+    out = bytearray()
+    i = 0
+    while i < len(cells):
+        j = i + 1
+        while j < len(cells) and j - i < 255 and cells[j] == cells[i]:
+            j += 1
+        out += bytes((j - i, cells[i]))
+        i = j
+    return bytes(out)
+
+def rle_decode(data):
+    # data is normally a memoryview into a mapped pack
+    if np is not None:
+        runs = np.frombuffer(data, np.uint8).reshape(-1, 2)
+        return np.repeat(runs[:, 1], runs[:, 0])
+    out = bytearray()
+    for i in range(0, len(data), 2):
+        out += bytes((data[i + 1],)) * data[i]
+    return out
+
+def pack_level(rows):
+    # (width, height, encoding, data) for one level's grid
+    width = max(map(len, rows))
+    cells = b"".join(row.encode("ascii").ljust(width, b"\0") for row in rows)
+    packed = rle_encode(cells)
+    return (width, len(rows)) + ((PACK_RLE, packed) if len(packed) < len(cells) else (PACK_RAW, cells))
+
+def save_level_pack(path, seeds):
+    """Write {seed: {level_id: rows}} as a level pack, storing each distinct grid once"""
+    return write_level_pack(path, [(seed, level_id, pack_level(rows)) for seed, levels in seeds.items() for level_id, rows in levels.items()])
+
+def write_level_pack(path, levels):
+    # levels: (seed, level_id, pack_level() output) triples; returns how many distinct grids were stored
+    end = LEVEL_PACK_HEADER.size + len(levels) * LEVEL_PACK_ENTRY.size
+    entries, grids, stored = [], [], {}  # stored: content hash -> offset
+    for seed, level_id, (width, height, encoding, data) in levels:
+        digest = hashlib.sha1(bytes((encoding,)) + data).digest()
+        if digest not in stored:
+            stored[digest] = end
+            grids.append(data)
+            end += len(data)
+        theme = int(level_id.split("-")[0])
+        entries.append(LEVEL_PACK_ENTRY.pack(level_id.encode("ascii"), width, height, theme, seed, encoding, stored[digest], len(data)))
+    with open(path, "wb") as f:
+        f.write(LEVEL_PACK_HEADER.pack(LEVEL_PACK_MAGIC, LEVEL_PACK_VERSION, len(levels)))
+        f.writelines(entries)
+        f.writelines(grids)
+    return len(grids)
+
+class LevelPack:
+    """A level pack mapped into memory; a level's grid is read out of the mapping only when asked for"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, version, count = LEVEL_PACK_HEADER.unpack_from(self.view)
+        if magic != LEVEL_PACK_MAGIC or version != LEVEL_PACK_VERSION:
+            raise ValueError(f"{path} is not a version {LEVEL_PACK_VERSION} level pack")
+        self.entries = {}  # (seed, level_id) -> (width, height, theme, encoding, offset, size)
+        index = self.view[LEVEL_PACK_HEADER.size:LEVEL_PACK_HEADER.size + count * LEVEL_PACK_ENTRY.size]
+        for level_id, width, height, theme, seed, encoding, offset, size in LEVEL_PACK_ENTRY.iter_unpack(index):
+            self.entries[seed, level_id.rstrip(b"\0").decode("ascii")] = (width, height, theme, encoding, offset, size)
+        index.release()
+    def __contains__(self, key):
+        return key in self.entries
+    def seeds(self):
+        return list(dict.fromkeys(seed for seed, level_id in self.entries))
+    def cells(self, seed, level_id):
+        # Raw grids are a zero-copy slice of the mapping; RLE ones are decoded from one
+        width, height, theme, encoding, offset, size = self.entries[seed, level_id]
+        data = self.view[offset:offset + size]
+        return data if encoding == PACK_RAW else rle_decode(data)
+    def grid(self, seed, level_id):
+        """height x width uint8 tile ids (the flat buffer without numpy)"""
+        cells = self.cells(seed, level_id)
+        if np is None:
+            return cells
+        width, height = self.entries[seed, level_id][:2]
+        return np.frombuffer(cells, np.uint8).reshape(height, width)
+    def rows(self, seed, level_id):
+        # Back to the row strings the engine builds levels from, short rows as short as they were
+        width = self.entries[seed, level_id][0]
+        cells = bytes(self.cells(seed, level_id))
+        return [cells[x:x + width].rstrip(b"\0").decode("ascii") for x in range(0, len(cells), width)]
+
+# Seed for the randomized levels; replay files store it so a run can be rebuilt exactly
+LEVEL_SEED = random.randrange(2 ** 32)
+# True once the seed was chosen (--seed, a level pack, a replay) rather than drawn for this launch
+LEVEL_SEED_PINNED = False
+# Set by --level-pack; levels it holds for the current seed are read from it rather than generated
+level_pack = None
+
+def make_level(level_id):
+    if level_pack is not None and (LEVEL_SEED, level_id) in level_pack:
+        return level_pack.rows(LEVEL_SEED, level_id)
+    return generate_level(LEVEL_SEED, level_id)
+
+LEVELS = LevelCache("levels", make_level, LEVEL_IDS, LEVEL_CACHE_SIZE)
 
-LEVELS = generate_level_data()
+def use_level_pack(path):
+    # Keep the current seed if the pack has it, else play the pack's first one; a pinned seed (--seed) it lacks is an error
+    global level_pack, LEVEL_SEED, LEVEL_SEED_PINNED
+    pack = LevelPack(path)
+    seeds = pack.seeds()
+    if seeds and LEVEL_SEED not in seeds:
+        if LEVEL_SEED_PINNED:
+            raise ValueError(f"{path} holds no levels for seed {LEVEL_SEED}")
+        LEVEL_SEED = seeds[0]
+    level_pack = pack
+    LEVEL_SEED_PINNED = LEVEL_SEED_PINNED or bool(seeds)
+    LEVELS.clear()
+    THUMBNAILS.clear()
 
-# Create thumbnails
-THUMBNAILS = {}
-for level_id, level_data in LEVELS.items():
+def make_thumbnail(level_id):
     world = int(level_id.split("-")[0])
     theme = WORLD_THEMES[world]
     thumb = pygame.Surface((32, 24))
     thumb.fill(NES_PALETTE[theme["sky"]])
-    for y, row in enumerate(level_data[10:18]):
+    for y, row in enumerate(LEVELS[level_id][10:18]):
         for x, char in enumerate(row[::6]):
             if char in ("#", "=", "P", "T", "t", "C"):
                 thumb.set_at((x, y+8), NES_PALETTE[theme["ground"]])
             elif char == "?":
                 thumb.set_at((x, y+8), NES_PALETTE[35])
-    THUMBNAILS[level_id] = thumb
+    return thumb
+
+THUMBNAILS = LevelCache("thumbnails", make_thumbnail, LEVEL_IDS, THUMBNAIL_CACHE_SIZE)
 
 class Entity:
+    __slots__ = ()  # Player gets a __dict__; enemies keep their state in an EntityStore
     def __init__(self, x, y):
         self.x = x
         self.y = y
+        self.prev_x = x  # position before the last simulation step
+        self.prev_y = y
         self.vx = 0
         self.vy = 0
         self.width = TILE
@@ -257,29 +821,36 @@ class Entity:
         return pygame.Rect(self.x, self.y, self.width, self.height)
     def check_collision(self, other):
         return self.get_rect().colliderect(other.get_rect())
-    def update(self, colliders, dt):
+    def update(self, tiles, dt):
         if not self.on_ground:
             self.vy += 0.5 * dt * 60
-        self.x += self.vx * dt * 60
-        self.y += self.vy * dt * 60
         self.on_ground = False
-        for rect in colliders:
-            if self.get_rect().colliderect(rect):
-                if self.vy > 0 and self.y + self.height > rect.top and self.y < rect.top:
-                    self.y = rect.top - self.height
-                    self.vy = 0
-                    self.on_ground = True
-                elif self.vy < 0 and self.y < rect.bottom and self.y + self.height > rect.bottom:
-                    self.y = rect.bottom
-                    self.vy = 0
-                if self.vx > 0 and self.x + self.width > rect.left and self.x < rect.left:
-                    self.x = rect.left - self.width
-                    self.vx = 0
-                elif self.vx < 0 and self.x < rect.right and self.x + self.width > rect.right:
-                    self.x = rect.right
-                    self.vx = 0
-    def draw(self, surf, cam):
+        # Along x, then along y: each axis stops at the first solid face ahead, however far the step
+        dx = self.vx * dt * 60
+        if dx:
+            self.x, hit = tiles.sweep_box(self.x, self.y, self.width, self.height, dx, 0)
+            if hit:
+                self.vx = 0
+        dy = self.vy * dt * 60
+        if dy:
+            self.y, hit = tiles.sweep_box(self.x, self.y, self.width, self.height, 0, dy)
+            if hit:
+                self.on_ground = dy > 0
+                self.vy = 0
+    def sprite_key(self):
+        # Everything the entity's look depends on; one cached sprite per distinct key
+        return ()
+    def paint(self, surf, x, y, key):
         pass
+    def draw(self, surf, cam, alpha=1.0):
+        if not self.active:
+            return
+        sprite, ox, oy = entity_sprites.get(self)
+        if sprite is not None:
+            x = self.prev_x + (self.x - self.prev_x) * alpha
+            y = self.prev_y + (self.y - self.prev_y) * alpha
+            surf.blit(sprite, (int(x - cam) + ox, int(y) + oy))
+            counters.add("draw.blits")
 
 class Player(Entity):
     def __init__(self, x, y):
@@ -290,8 +861,8 @@ class Player(Entity):
         self.invincible = 0
         self.animation_frame = 0
         self.walk_timer = 0
-    def update(self, colliders, dt, enemies):
-        keys = pygame.key.get_pressed()
+    def update(self, tiles, dt, store):
+        keys = controls.pressed()
         self.vx = 0
         speed = self.run_speed if keys[K_LSHIFT] or keys[K_RSHIFT] else self.move_speed
         if keys[K_LEFT]:
@@ -312,8 +883,9 @@ class Player(Entity):
             self.animation_frame = 0
         if self.invincible > 0:
             self.invincible -= dt
-        super().update(colliders, dt)
-        for enemy in enemies:
+        super().update(tiles, dt)
+        for enemy in store.touching(self):
+            counters.add("collision.player_enemy")
             if enemy.active and self.check_collision(enemy):
                 if self.vy > 0 and self.y + self.height - 5 < enemy.y:
                     enemy.active = False
@@ -326,29 +898,35 @@ class Player(Entity):
                     else:
                         state.lives -= 1
                         if state.lives <= 0:
-                            push(GameOverScene())
+                            reset_to(GameOverScene())
                         else:
                             self.x = 50
                             self.y = 100
                             self.vx = 0
                             self.vy = 0
-    def draw(self, surf, cam):
+                            self.prev_x, self.prev_y = self.x, self.y  # respawn is a jump, not a move
+    def draw(self, surf, cam, alpha=1.0):
         if self.invincible > 0 and int(self.invincible * 10) % 2 == 0:
             return
-        x = int(self.x - cam)
-        y = int(self.y)
-        if state.mario_size == "big":
+        super().draw(surf, cam, alpha)
+    def sprite_key(self):
+        big = state.mario_size == "big"
+        frame = self.animation_frame if big and self.vx != 0 else 0
+        return (big, frame, self.facing_right)
+    def paint(self, surf, x, y, key):
+        big, frame, facing_right = key
+        if big:
             pygame.draw.rect(surf, NES_PALETTE[33], (x+4, y+8, 8, 16))
             pygame.draw.rect(surf, NES_PALETTE[39], (x+4, y+4, 8, 4))
             pygame.draw.rect(surf, NES_PALETTE[33], (x+2, y, 12, 4))
             arm_offset = 0
-            if self.animation_frame == 1 and self.vx != 0:
-                arm_offset = 2 if self.facing_right else -2
+            if frame == 1:
+                arm_offset = 2 if facing_right else -2
             pygame.draw.rect(surf, NES_PALETTE[39], (x+arm_offset, y+10, 4, 6))
             pygame.draw.rect(surf, NES_PALETTE[39], (x+12-arm_offset, y+10, 4, 6))
             leg_offset = 0
-            if self.animation_frame == 2 and self.vx != 0:
-                leg_offset = 2 if self.facing_right else -2
+            if frame == 2:
+                leg_offset = 2 if facing_right else -2
             pygame.draw.rect(surf, NES_PALETTE[21], (x+2, y+24, 4, 8))
             pygame.draw.rect(surf, NES_PALETTE[21], (x+10, y+24-leg_offset, 4, 8+leg_offset))
         else:
@@ -356,105 +934,127 @@ class Player(Entity):
             pygame.draw.rect(surf, NES_PALETTE[39], (x+4, y, 8, 8))
             pygame.draw.rect(surf, NES_PALETTE[33], (x+2, y, 12, 2))
 
-class Goomba(Entity):
-    def __init__(self, x, y):
+class Column:
+    """Enemy attribute stored in a column of the enemy's EntityStore"""
+    def __init__(self, name):
+        self.name = name
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return view.store.read[self.name](view.slot)
+    def __set__(self, view, value):
+        view.store.columns[self.name][view.slot] = value
+
+class Enemy(Entity):
+    """Entity whose state is one row of an EntityStore; update() is the one-at-a-time path"""
+    __slots__ = ("store", "slot")
+    x, y = Column("x"), Column("y")
+    prev_x, prev_y = Column("prev_x"), Column("prev_y")
+    vx, vy = Column("vx"), Column("vy")
+    width, height = Column("width"), Column("height")
+    on_ground, facing_right, active = Column("on_ground"), Column("facing_right"), Column("active")
+    # Behaviour flags, copied into the store row for EntityStore.step()
+    turns_at_ledges = False
+    swims = False
+    moves = True
+    walk_period = 0  # seconds per walk frame; 0 for no walk cycle
+    def __init__(self, x, y, store):
+        self.store = store
+        self.slot = store.add(self)
         super().__init__(x, y)
+
+class Goomba(Enemy):
+    __slots__ = ()
+    animation_frame, walk_timer = Column("frame"), Column("timer")
+    turns_at_ledges = True
+    walk_period = 0.2
+    def __init__(self, x, y, store):
+        super().__init__(x, y, store)
         self.vx = -0.5
         self.animation_frame = 0
         self.walk_timer = 0
-    def update(self, colliders, dt):
+    def update(self, tiles, dt):
         if self.on_ground:
-            edge_check = pygame.Rect(self.x + (self.width if self.vx > 0 else -1), self.y + self.height, 1, 1)
-            edge_found = False
-            for rect in colliders:
-                if edge_check.colliderect(rect):
-                    edge_found = True
-                    break
-            if not edge_found:
+            # Turn around at ledges
+            if not tiles.solid_at(self.x + (self.width if self.vx > 0 else -1), self.y + self.height):
                 self.vx *= -1
-        super().update(colliders, dt)
+        super().update(tiles, dt)
         self.walk_timer += dt
-        if self.walk_timer > 0.2:
+        if self.walk_timer > self.walk_period:
             self.walk_timer = 0
             self.animation_frame = (self.animation_frame + 1) % 2
-    def draw(self, surf, cam):
-        if not self.active:
-            return
-        x = int(self.x - cam)
-        y = int(self.y)
+    def sprite_key(self):
+        return (self.animation_frame, self.vx > 0)
+    def paint(self, surf, x, y, key):
+        frame, moving_right = key
         pygame.draw.ellipse(surf, NES_PALETTE[21], (x+2, y+4, 12, 12))
-        foot_offset = 2 if self.animation_frame == 0 else -2
+        foot_offset = 2 if frame == 0 else -2
         pygame.draw.rect(surf, NES_PALETTE[21], (x+2, y+14, 4, 2))
         pygame.draw.rect(surf, NES_PALETTE[21], (x+10, y+14+foot_offset, 4, 2))
-        eye_dir = 0 if self.vx > 0 else 2
+        eye_dir = 0 if moving_right else 2
         pygame.draw.rect(surf, NES_PALETTE[0], (x+4+eye_dir, y+6, 2, 2))
         pygame.draw.rect(surf, NES_PALETTE[0], (x+10-eye_dir, y+6, 2, 2))
 
 class Koopa(Goomba):
     """Koopa Troopa enemy - the ONLY class using 'Koopa' naming"""
-    def __init__(self, x, y):
-        super().__init__(x, y)
+    __slots__ = ("shell_mode",)
+    def __init__(self, x, y, store):
+        super().__init__(x, y, store)
         self.shell_mode = False
-    def draw(self, surf, cam):
-        if not self.active:
-            return
-        x = int(self.x - cam)
-        y = int(self.y)
+    def sprite_key(self):
+        return (self.shell_mode,)
+    def paint(self, surf, x, y, key):
+        shell_mode, = key
         pygame.draw.ellipse(surf, NES_PALETTE[14], (x+2, y+4, 12, 12))
-        if not self.shell_mode:
+        if not shell_mode:
             pygame.draw.rect(surf, NES_PALETTE[39], (x+4, y, 8, 4))
             pygame.draw.rect(surf, NES_PALETTE[14], (x+2, y+14, 4, 2))
             pygame.draw.rect(surf, NES_PALETTE[14], (x+10, y+14, 4, 2))
 
-class Fish(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y)
+class Fish(Enemy):
+    __slots__ = ()
+    swim_timer = Column("timer")
+    swims = True
+    def __init__(self, x, y, store):
+        super().__init__(x, y, store)
         self.vx = -0.5
         self.swim_timer = 0
-    def update(self, colliders, dt):
+    def update(self, tiles, dt):
         self.swim_timer += dt
         self.y += math.sin(self.swim_timer * 5) * 0.5
-        super().update(colliders, dt)
-    def draw(self, surf, cam):
-        if not self.active:
-            return
-        x = int(self.x - cam)
-        y = int(self.y)
+        super().update(tiles, dt)
+    def paint(self, surf, x, y, key):
         pygame.draw.ellipse(surf, NES_PALETTE[31], (x, y, 16, 8))
         pygame.draw.polygon(surf, NES_PALETTE[31], [(x, y+4), (x-5, y), (x-5, y+8)])
         pygame.draw.circle(surf, NES_PALETTE[0], (x+12, y+4), 2)
 
-class Spike(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y)
-    def update(self, colliders, dt):
+class Spike(Enemy):
+    __slots__ = ()
+    moves = False
+    def __init__(self, x, y, store):
+        super().__init__(x, y, store)
+    def update(self, tiles, dt):
         pass
-    def draw(self, surf, cam):
-        if not self.active:
-            return
-        x = int(self.x - cam)
-        y = int(self.y)
+    def paint(self, surf, x, y, key):
         # Fire bar style
         pygame.draw.rect(surf, NES_PALETTE[22], (x+2, y+2, 12, 12))
         pygame.draw.rect(surf, NES_PALETTE[33], (x+4, y+4, 8, 8))
         pygame.draw.rect(surf, NES_PALETTE[35], (x+6, y+6, 4, 4))
 
-class Bowser(Entity):
+class Bowser(Enemy):
     """Final boss"""
-    def __init__(self, x, y):
-        super().__init__(x, y)
+    __slots__ = ()
+    fire_timer = Column("timer")
+    def __init__(self, x, y, store):
+        super().__init__(x, y, store)
         self.width = TILE * 2
         self.height = TILE * 2
         self.vx = -0.3
         self.fire_timer = 0
-    def update(self, colliders, dt):
+    def update(self, tiles, dt):
         self.fire_timer += dt
-        super().update(colliders, dt)
-    def draw(self, surf, cam):
-        if not self.active:
-            return
-        x = int(self.x - cam)
-        y = int(self.y)
+        super().update(tiles, dt)
+    def paint(self, surf, x, y, key):
         # Bowser body
         pygame.draw.rect(surf, NES_PALETTE[14], (x, y, 32, 32))
         pygame.draw.rect(surf, NES_PALETTE[35], (x+4, y+4, 24, 20))
@@ -469,22 +1069,525 @@ class Bowser(Entity):
                 (x+8+i*8, y), (x+4+i*8, y-8), (x+12+i*8, y-8)
             ])
 
+# Level chars that place an enemy
+ENEMY_KINDS = {"E": Goomba, "K": Koopa, "F": Fish, "H": Spike, "B": Bowser}
+
+def spawn_table(rows):
+    # Every enemy of a level as (column, row, char), sorted by column for LevelScene's spawn pointer
+    return sorted((x, y, char) for y, row in enumerate(rows) for x, char in enumerate(row) if char in ENEMY_KINDS)
+
+class EntityStore:
+    """Enemy state as parallel columns, one row per enemy; step() updates every row in one numpy pass"""
+    FLOATS = ("x", "y", "prev_x", "prev_y", "vx", "vy", "width", "height", "timer", "walk_period")
+    FLAGS = ("on_ground", "facing_right", "active", "turns_at_ledges", "swims", "moves")
+    INTS = ("kind", "frame")
+    def __init__(self):
+        self.views = []  # enemy objects in row order
+        self.kinds = []  # enemy classes; the kind column indexes this
+        self.columns = {}
+        self.read = {}  # column name -> getter returning plain Python values
+        self.pool = defaultdict(list)  # released views by class, reused by spawn()
+        self.count = 0
+        self.capacity = 0
+    def grow(self, capacity):
+        # Without numpy the columns are plain lists and the batched step is unavailable
+        for names, dtype in ((self.FLOATS, float), (self.FLAGS, bool), (self.INTS, int)):
+            for name in names:
+                if np is None:
+                    column = self.columns.setdefault(name, [])
+                    column.extend([dtype()] * (capacity - len(column)))
+                    self.read[name] = column.__getitem__
+                else:
+                    column = np.zeros(capacity, dtype)
+                    if name in self.columns:
+                        column[:self.count] = self.columns[name][:self.count]
+                    self.columns[name] = column
+                    self.read[name] = column.item
+        self.capacity = capacity
+    def add(self, view):
+        # Row for a new enemy, with its class's behaviour flags filled in
+        if self.count == self.capacity:
+            self.grow(max(self.capacity * 2, 64))
+        slot = self.count
+        self.count += 1
+        for names, dtype in ((self.FLOATS, float), (self.FLAGS, bool), (self.INTS, int)):
+            for name in names:
+                self.columns[name][slot] = dtype()  # rows are reused after release()
+        kind = type(view)
+        if kind not in self.kinds:
+            self.kinds.append(kind)
+        self.columns["kind"][slot] = self.kinds.index(kind)
+        for name in ("turns_at_ledges", "swims", "moves", "walk_period"):
+            self.columns[name][slot] = getattr(kind, name)
+        self.views.append(view)
+        return slot
+    def spawn(self, kind, x, y):
+        # New enemy of kind at (x, y), reusing a released view object when one is pooled
+        pool = self.pool[kind]
+        view = pool.pop() if pool else kind.__new__(kind)
+        view.__init__(x, y, self)
+        return view
+    def release(self, view):
+        # Drop view's row (the last row moves into it) and pool the view for spawn()
+        slot, last = view.slot, self.count - 1
+        if slot != last:
+            moved = self.views[last]
+            for column in self.columns.values():
+                column[slot] = column[last]
+            moved.slot = slot
+            self.views[slot] = moved
+        self.views.pop()
+        self.count = last
+        self.pool[type(view)].append(view)
+    def release_behind(self, left):
+        # Release every enemy whose right edge is left of x = left; returns how many went
+        if np is None or not self.count:
+            gone = [view for view in self.views if view.x + view.width < left]
+        else:
+            n = self.count
+            rows = np.flatnonzero(self.columns["x"][:n] + self.columns["width"][:n] < left)
+            gone = [self.views[row] for row in rows]
+        return self.release_all(gone)
+    def release_below(self, bottom):
+        # Release every enemy whose top edge is below y = bottom, fallen out of the map; returns how many went
+        if np is None or not self.count:
+            gone = [view for view in self.views if view.y > bottom]
+        else:
+            gone = [self.views[row] for row in np.flatnonzero(self.columns["y"][:self.count] > bottom)]
+        return self.release_all(gone)
+    def release_dead(self):
+        # Compact enemies that are no longer active out of the store; returns how many went
+        if np is None or not self.count:
+            gone = [view for view in self.views if not view.active]
+        else:
+            gone = [self.views[row] for row in np.flatnonzero(~self.columns["active"][:self.count])]
+        return self.release_all(gone)
+    def release_all(self, gone):
+        # Release views given in row order
+        for view in reversed(gone):  # highest row first, so no row still to go gets moved
+            self.release(view)
+        return len(gone)
+    def schedule(self, left, right, tick):
+        # Which rows update this step, by distance from the screen [left, right): (every step, LOD step)
+        near = LOD_MARGIN if LOD_EVERY > 1 else WAKE_MARGIN
+        lod_tick = tick % LOD_EVERY == 0
+        if np is None or not self.count:
+            edges = [(view.x, view.x + view.width) for view in self.views]
+            full = [x1 > left - near and x0 < right + near for x0, x1 in edges]
+            awake = [x1 > left - WAKE_MARGIN and x0 < right + WAKE_MARGIN for x0, x1 in edges]
+            return full, [lod_tick and a and not f for a, f in zip(awake, full)]
+        x0 = self.columns["x"][:self.count]
+        x1 = x0 + self.columns["width"][:self.count]
+        full = (x1 > left - near) & (x0 < right + near)
+        awake = (x1 > left - WAKE_MARGIN) & (x0 < right + WAKE_MARGIN)
+        return full, awake & ~full & lod_tick
+    def clear(self):
+        # Forget every enemy and free the columns
+        self.views.clear()
+        self.kinds.clear()
+        self.pool.clear()
+        self.columns.clear()
+        self.read.clear()
+        self.count = self.capacity = 0
+    def snapshot(self):
+        n = self.count
+        if n:
+            self.columns["prev_x"][:n] = self.columns["x"][:n]
+            self.columns["prev_y"][:n] = self.columns["y"][:n]
+    def visible(self, left, right):
+        # Active enemies whose sprite can reach [left, right) this frame, in row order
+        if np is None or not self.count:
+            return self.views
+        c = {name: self.columns[name][:self.count] for name in ("x", "prev_x", "width", "active")}
+        near = c["active"] & (np.maximum(c["x"], c["prev_x"]) + c["width"] + TILE > left)
+        near &= np.minimum(c["x"], c["prev_x"]) - TILE < right
+        return [self.views[i] for i in np.flatnonzero(near)]
+    def sweep(self):
+        # Broadphase: active rows sorted by left edge (sweep and prune on x), rebuilt before each use
+        rows = np.flatnonzero(self.columns["active"][:self.count])
+        x = self.columns["x"][rows]
+        order = np.argsort(x, kind="stable")
+        self.sweep_rows, self.sweep_left = rows[order], x[order]
+        self.sweep_reach = self.columns["width"][rows].max() if rows.size else 0
+    def overlapping(self, rect):
+        # Rows from the last sweep that may overlap rect, in row order; a pixel of slack covers Rect truncation
+        lo = np.searchsorted(self.sweep_left, rect.left - self.sweep_reach - 1)
+        hi = np.searchsorted(self.sweep_left, rect.right + 1)
+        rows = self.sweep_rows[lo:hi]
+        x, y = self.columns["x"][rows], self.columns["y"][rows]
+        near = x + self.columns["width"][rows] + 1 > rect.left
+        near &= (y - 1 < rect.bottom) & (y + self.columns["height"][rows] + 1 > rect.top)
+        return np.sort(rows[near])
+    def touching(self, entity):
+        # Enemies that may overlap entity, in row order; a hit that moves entity (respawn) re-queries the rest
+        if np is None or self.count < SWEEP_MIN_ENEMIES:
+            yield from self.views
+            return
+        self.sweep()
+        where = (entity.x, entity.y)
+        rows = self.overlapping(entity.get_rect()).tolist()
+        while rows:
+            row = rows.pop(0)
+            yield self.views[row]
+            if (entity.x, entity.y) != where:
+                where = (entity.x, entity.y)
+                rows = [other for other in self.overlapping(entity.get_rect()).tolist() if other > row]
+    def pairs(self, rows):
+        # Candidate (enemy, other enemy) pairs for each given row, for enemy-vs-enemy contact
+        if np is None or self.count < SWEEP_MIN_ENEMIES:
+            for row in rows:
+                for other in self.views:
+                    if other is not self.views[row]:
+                        yield self.views[row], other
+            return
+        self.sweep()
+        for row in rows:
+            for other in self.overlapping(self.views[row].get_rect()).tolist():
+                if other != row:
+                    yield self.views[row], self.views[other]
+    def step(self, tiles, dt, rows=None):
+        # Enemy update() for every active row (of the rows mask, if given) at once: same arithmetic, same order;
+        # returns how many ran
+        n = self.count
+        if not n:
+            return 0
+        c = {name: column[:n] for name, column in self.columns.items()}
+        x, y, vx, vy, timer, on_ground = c["x"], c["y"], c["vx"], c["vy"], c["timer"], c["on_ground"]
+        live = c["active"] if rows is None else c["active"] & rows
+        ran = int(live.sum())
+        run = live & c["moves"]
+        # Turn around at ledges, probing from where the step starts
+        probe = np.flatnonzero(run & c["turns_at_ledges"] & on_ground)
+        if probe.size:
+            ahead = x[probe] + np.where(vx[probe] > 0, c["width"][probe], -1)
+            vx[probe[~tiles.solid_cells(ahead, y[probe] + c["height"][probe])]] *= -1
+        timer[run] += dt
+        swim = run & c["swims"]
+        y[swim] += np.sin(timer[swim] * 5) * 0.5
+        vy[run & ~on_ground] += 0.5 * dt * 60
+        on_ground[run] = False
+        self.collide(tiles, np.flatnonzero(run), dt)
+        walk = run & (c["walk_period"] > 0) & (timer > c["walk_period"])
+        timer[walk] = 0
+        c["frame"][walk] = (c["frame"][walk] + 1) % 2
+        return ran
+    def collide(self, tiles, rows, dt):
+        # Entity.update's swept move for many rows: along x, then along y
+        if not rows.size:
+            return
+        c = self.columns
+        x, y, vx, vy = c["x"][rows], c["y"][rows], c["vx"][rows], c["vy"][rows]
+        w, h = c["width"][rows], c["height"][rows]
+        on_ground = np.zeros(rows.size, bool)
+        d = vx * dt * 60
+        i = np.flatnonzero(d)
+        x[i], hit = tiles.sweep_boxes(x[i], y[i], w[i], h[i], d[i], 0)
+        vx[i[hit]] = 0
+        d = vy * dt * 60
+        i = np.flatnonzero(d)
+        y[i], hit = tiles.sweep_boxes(x[i], y[i], w[i], h[i], d[i], 1)
+        i = i[hit]
+        on_ground[i] = d[i] > 0
+        vy[i] = 0
+        c["x"][rows], c["y"][rows], c["vx"][rows], c["vy"][rows] = x, y, vx, vy
+        c["on_ground"][rows] = on_ground
+
+def crop_sprite(surf, pad_x, pad_y):
+    # Crop a BAKE_KEY-filled scratch surface painted at (pad_x, pad_y) down to what was drawn
+    box = surf.get_bounding_rect()
+    if not box.w or not box.h:
+        return None, 0, 0
+    sprite = surf.subsurface(box).copy()
+    if pygame.display.get_surface() is not None:
+        sprite = sprite.convert()
+    sprite.set_colorkey(BAKE_KEY, RLEACCEL)
+    return sprite, box.x - pad_x, box.y - pad_y
+
+class EntitySprites:
+    """Entity looks rendered once per (class, sprite_key())"""
+    def __init__(self):
+        self.sprites = {}
+    def get(self, entity):
+        # (surface or None, x offset, y offset) relative to the entity's position
+        key = (type(entity), entity.sprite_key())
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.sprites[key] = self.render(entity, key[1])
+        return sprite
+    def render(self, entity, key):
+        # Entities may paint up to a tile outside their box (heads, tails, big Mario's legs)
+        pad = TILE
+        surf = pygame.Surface((entity.width + pad * 2, entity.height + pad * 2))
+        surf.fill(BAKE_KEY)
+        surf.set_colorkey(BAKE_KEY)
+        entity.paint(surf, pad, pad, key)
+        counters.add("sprites.rendered")
+        return crop_sprite(surf, pad, pad)
+
+entity_sprites = EntitySprites()
+
+class TileSprites:
+    """Every distinct tile look rendered once, keyed by (world, tile char, frame)"""
+    def __init__(self):
+        self.sprites = {}
+    def get(self, world, char, frame=0):
+        # (surface or None, x offset, y offset) relative to the tile's cell
+        key = (world, char, frame)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.sprites[key] = self.render(char, frame)
+        return sprite
+    def warm(self, world, chars):
+        for char in chars:
+            for frame in TILE_FRAMES.get(char, (0,)):
+                self.get(world, char, frame)
+    def footprint(self):
+        # Bytes of pixel data held by the cache
+        return sum(s.get_bytesize() * s.get_width() * s.get_height() for s, _, _ in self.sprites.values() if s)
+    def render(self, char, frame):
+        # Paint with room for art that leaves the cell, then crop to what was drawn
+        pad_x, pad_y = TILE_OVERHANG, TILE * 6
+        surf = pygame.Surface((TILE + pad_x * 2, TILE + pad_y * 2))
+        surf.fill(BAKE_KEY)
+        surf.set_colorkey(BAKE_KEY)
+        self.paint(surf, char, pad_x, pad_y, frame)
+        counters.add("sprites.rendered")
+        return crop_sprite(surf, pad_x, pad_y)
+    def paint(self, surf, char, draw_x, y, frame):
+        if char == "#":
+            # Ground
+            pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+2, y+2, TILE-4, TILE-4))
+        elif char == "=":
+            # Brick
+            pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+1, y+1, 6, 6))
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+9, y+1, 6, 6))
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+1, y+9, 6, 6))
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+9, y+9, 6, 6))
+        elif char == "?":
+            # Question block
+            pygame.draw.rect(surf, NES_PALETTE[35], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[33], (draw_x+2, y+2, TILE-4, TILE-4))
+            pygame.draw.rect(surf, NES_PALETTE[39], (draw_x+5, y+4, 6, 3))
+            pygame.draw.rect(surf, NES_PALETTE[39], (draw_x+8, y+7, 3, 3))
+            pygame.draw.rect(surf, NES_PALETTE[39], (draw_x+6, y+10, 4, 2))
+        elif char == "U":
+            # Used block
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[0], (draw_x+2, y+2, TILE-4, TILE-4))
+        elif char == "T":
+            # Pipe top
+            pygame.draw.rect(surf, NES_PALETTE[14], (draw_x-2, y, TILE+4, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[37], (draw_x, y+2, 4, TILE-2))
+            pygame.draw.rect(surf, NES_PALETTE[0], (draw_x+TILE-2, y+2, 2, TILE-2))
+        elif char == "t":
+            # Pipe body
+            pygame.draw.rect(surf, NES_PALETTE[14], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[37], (draw_x+2, y, 4, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[0], (draw_x+TILE-2, y, 2, TILE))
+        elif char == "L":
+            # Flag pole
+            pygame.draw.rect(surf, NES_PALETTE[14], (draw_x+6, y, 4, TILE*6))
+            pygame.draw.rect(surf, NES_PALETTE[37], (draw_x+7, y, 2, TILE*6))
+            # Flag
+            pygame.draw.polygon(surf, NES_PALETTE[14], [
+                (draw_x+10, y+8), (draw_x+26, y+16), (draw_x+10, y+24)
+            ])
+            # Ball on top
+            pygame.draw.circle(surf, NES_PALETTE[14], (draw_x+8, y-4), 6)
+        elif char == "C":
+            # Castle
+            pygame.draw.rect(surf, NES_PALETTE[0], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[28], (draw_x+2, y+2, TILE-4, TILE-4))
+        elif char == "b":
+            # Bridge
+            pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, 8))
+            pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+2, y+2, TILE-4, 4))
+        elif char == "A":
+            # Lava
+            pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, TILE))
+            pygame.draw.rect(surf, NES_PALETTE[33], (draw_x+2, y+2, TILE-4, TILE-4))
+            # Animated bubbles
+            bubble_y = y + 4 + frame
+            pygame.draw.circle(surf, NES_PALETTE[35], (draw_x+8, bubble_y), 3)
+        elif char == "X":
+            # Axe
+            pygame.draw.rect(surf, NES_PALETTE[35], (draw_x+4, y+2, 8, 12))
+            pygame.draw.rect(surf, NES_PALETTE[33], (draw_x+6, y+4, 4, 8))
+            pygame.draw.polygon(surf, NES_PALETTE[28], [
+                (draw_x+2, y+4), (draw_x+6, y+2), (draw_x+6, y+10), (draw_x+2, y+8)
+            ])
+
+tile_sprites = TileSprites()
+
+def greedy_rects(cells):
+    # Cover (tx, ty) cells with maximal rectangles: the longest run along a row, then down while full
+    left = set(cells)
+    rects = []
+    for tx, ty in sorted(left, key=lambda cell: (cell[1], cell[0])):
+        if (tx, ty) not in left:
+            continue
+        w = 1
+        while (tx + w, ty) in left:
+            w += 1
+        h = 1
+        while all((x, ty + h) in left for x in range(tx, tx + w)):
+            h += 1
+        covered = [(x, y) for y in range(ty, ty + h) for x in range(tx, tx + w)]
+        left.difference_update(covered)
+        rects.append((pygame.Rect(tx * TILE, ty * TILE, w * TILE, h * TILE), covered))
+    return rects
+
 class TileMap:
-    def __init__(self, level_data, level_id):
-        self.tiles = []
-        self.colliders = []
-        self.width = len(level_data[0]) * TILE
-        self.height = len(level_data) * TILE
+    def __init__(self, level_data, level_id, compiled=None):
+        # Parsing is compile_level()'s job; LevelScene passes one read back from the level cache
+        if compiled is None:
+            compiled = compile_level(level_data, level_id)
+        # Tile chars row by row, " " where there is no tile; drawing walks only the visible columns
+        self.rows = [list(row) for row in compiled["rows"]]
+        self.width = len(self.rows[0]) * TILE
+        self.height = len(self.rows) * TILE
         self.level_id = level_id
         world = int(level_id.split("-")[0])
+        self.world = world
         self.theme = WORLD_THEMES[world]
-        for y, row in enumerate(level_data):
-            for x, char in enumerate(row):
+        # Solidity grid: grid[ty][tx] holds the collider rect of a solid tile, else None
+        self.grid = [[None] * len(row) for row in self.rows]
+        self.grid_columns = max(map(len, self.grid))  # of the widest row; sweeps stop at the grid's edges
+        for x, y in compiled["solid"]:
+            self.grid[y][x] = pygame.Rect(x * TILE, y * TILE, TILE, TILE)
+        # Merged colliders for code that scans them all; collisions still resolve per grid cell
+        self.colliders = []
+        self.collider_cells = []  # collider index -> the cells it covers
+        self.cell_collider = {}  # (tx, ty) -> collider index, to split a collider when a cell goes
+        for rect, covered in compiled["colliders"]:
+            self.add_collider(pygame.Rect(rect), covered)
+        # The same grid as booleans for EntityStore.step(), short rows padded with air
+        self.solid = None
+        if np is not None:
+            self.solid = np.zeros((len(self.grid), self.grid_columns), bool)
+            cells = np.array(compiled["solid"], np.intp).reshape(-1, 2)
+            self.solid[cells[:, 1], cells[:, 0]] = True
+        self.baked = BAKE_TILES
+        self.chunks = {}
+        chars = set().union(*compiled["rows"]) - {" "}
+        self.animated = chars & set(ANIMATED_TILES)
+        # Render every tile look this level uses up front
+        tile_sprites.warm(world, chars)
+    def add_collider(self, rect, cells):
+        for cell in cells:
+            self.cell_collider[cell] = len(self.colliders)
+        self.colliders.append(rect)
+        self.collider_cells.append(cells)
+
+    def remove_solid(self, tx, ty):
+        # Break one solid cell: it stops colliding and drawing; only the collider that covered it is re-meshed
+        index = self.cell_collider.pop((tx, ty), None)
+        if index is None:
+            return
+        self.grid[ty][tx] = None
+        self.rows[ty][tx] = " "
+        if self.solid is not None:
+            self.solid[ty, tx] = False
+        cells = [cell for cell in self.collider_cells[index] if cell != (tx, ty)]
+        # The last collider moves into the freed slot so indices stay dense
+        last = len(self.colliders) - 1
+        if index != last:
+            self.colliders[index], self.collider_cells[index] = self.colliders[last], self.collider_cells[last]
+            for cell in self.collider_cells[index]:
+                self.cell_collider[cell] = index
+        self.colliders.pop()
+        self.collider_cells.pop()
+        for rect, covered in greedy_rects(cells):
+            self.add_collider(rect, covered)
+        # Strips that drew the tile, its own and any its art overhangs, are rendered again
+        chunk_w = CHUNK_TILES * TILE
+        x = tx * TILE
+        for strip in range(-(-(x - chunk_w - TILE_OVERHANG) // chunk_w), (x + TILE + TILE_OVERHANG) // chunk_w + 1):
+            self.chunks.pop(strip, None)
+
+    def sweep_box(self, x, y, w, h, dx, dy):
+        # Slide a box along one axis (dx or dy is 0) up to the first solid cell face ahead: (new x or y, hit);
+        # only grid lines inside the map are walked, nothing outside is solid
+        d = dx or dy
+        lo, size, side, span = (x, w, y, h) if dx else (y, h, x, w)
+        count, across_count = (self.grid_columns, len(self.grid)) if dx else (len(self.grid), self.grid_columns)
+        if d > 0:
+            lines = range(max(math.ceil((lo + size) / TILE), 0), min(math.ceil((lo + size + d) / TILE), count))
+        else:
+            lines = range(min(math.floor(lo / TILE) - 1, count - 1), max(math.floor((lo + d) / TILE) - 1, -1), -1)
+        across = range(max(math.floor(side / TILE), 0), min(math.ceil((side + span) / TILE), across_count))
+        grid, tests = self.grid, 0
+        for line in lines:
+            tests += len(across)
+            for a in across:
+                tx, ty = (line, a) if dx else (a, line)
+                if 0 <= ty < len(grid) and 0 <= tx < len(grid[ty]) and grid[ty][tx] is not None:
+                    counters.add("collision.rect_tests", tests)
+                    return (line * TILE - size if d > 0 else (line + 1) * TILE), True
+        counters.add("collision.rect_tests", tests)
+        return lo + d, False
+    def solid_at(self, x, y):
+        # Same truncation as a 1x1 pygame.Rect probe at (x, y)
+        counters.add("collision.edge_probes")
+        tx, ty = int(x) // TILE, int(y) // TILE
+        if 0 <= ty < len(self.grid) and 0 <= tx < len(self.grid[ty]):
+            return self.grid[ty][tx] is not None
+        return False
+    def solid_cells(self, xs, ys):
+        # solid_at for arrays of points
+        counters.add("collision.edge_probes", len(xs))
+        return self.solid_tiles(np.trunc(xs) // TILE, np.trunc(ys) // TILE)
+    def solid_tiles(self, tx, ty):
+        # Solid flags for arrays of cell coordinates; cells off the grid are empty
+        inside = (tx >= 0) & (ty >= 0) & (ty < self.solid.shape[0]) & (tx < self.solid.shape[1])
+        hits = np.zeros(len(tx), bool)
+        hits[inside] = self.solid[ty[inside].astype(np.intp), tx[inside].astype(np.intp)]
+        return hits
+    def sweep_boxes(self, x, y, w, h, d, axis):
+        # sweep_box for arrays of boxes moving d along one axis (0: x, 1: y), one grid line per pass;
+        # like sweep_box, lines and cells outside the grid are skipped
+        lo, size, side, span = (x, w, y, h) if axis == 0 else (y, h, x, w)
+        count, across_count = self.solid.shape[::-1] if axis == 0 else self.solid.shape
+        ahead = d > 0
+        line = np.where(ahead, np.maximum(np.ceil((lo + size) / TILE), 0), np.minimum(np.floor(lo / TILE) - 1, count - 1))
+        stop = np.where(ahead, np.minimum(np.ceil((lo + size + d) / TILE), count), np.maximum(np.floor((lo + d) / TILE) - 1, -1))
+        step = np.where(ahead, 1, -1)
+        across0 = np.clip(np.floor(side / TILE), 0, across_count)
+        across1 = np.clip(np.ceil((side + span) / TILE), 0, across_count)
+        pos, hit = lo + d, np.zeros(len(d), bool)
+        live = np.where(ahead, line < stop, line > stop)
+        tests = 0
+        while live.any():
+            i = np.flatnonzero(live)
+            a0, a1 = across0[i], across1[i]
+            tests += int((a1 - a0).sum())
+            solid = np.zeros(i.size, bool)
+            for k in range(int((a1 - a0).max())):
+                a = a0 + k
+                solid |= (a < a1) & (self.solid_tiles(line[i], a) if axis == 0 else self.solid_tiles(a, line[i]))
+            i = i[solid]
+            pos[i] = np.where(ahead[i], line[i] * TILE - size[i], (line[i] + 1) * TILE)
+            hit[i] = True
+            line = line + step
+            live &= ~hit & (line != stop)
+        counters.add("collision.rect_tests", tests)
+        return pos, hit
+    def dispose(self):
+        # Release baked chunks and per-tile data; the map is unusable afterwards
+        self.chunks.clear()
+        self.rows, self.colliders, self.grid, self.animated = [], [], [], set()
+        self.collider_cells, self.cell_collider = [], {}
+        self.solid = None
+    def tiles_between(self, left, right):
+        # (x, y, char) of the tiles with left <= x <= right, row by row, looking only at those columns
+        first, last = max(-(-left // TILE), 0), right // TILE
+        for ty, row in enumerate(self.rows):
+            for tx in range(first, min(last + 1, len(row))):
+                char = row[tx]
                 if char != " ":
-                    rect = pygame.Rect(x * TILE, y * TILE, TILE, TILE)
-                    self.tiles.append((x * TILE, y * TILE, char))
-                    if char in ("#", "=", "P", "T", "t", "?", "U", "C", "b"):
-                        self.colliders.append(rect)
+                    yield tx * TILE, ty * TILE, char
     def draw(self, surf, cam):
         surf.fill(NES_PALETTE[self.theme["sky"]])
         # Clouds
@@ -506,74 +1609,160 @@ class TileMap:
             pygame.draw.ellipse(surf, NES_PALETTE[14], (bx+15, HEIGHT-80, 25, 18))
             pygame.draw.ellipse(surf, NES_PALETTE[14], (bx+30, HEIGHT-75, 28, 14))
         
-        for x, y, char in self.tiles:
-            draw_x = x - cam
-            if draw_x < -TILE or draw_x > WIDTH + TILE:
-                continue
-            if char == "#":
-                # Ground
-                pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+2, y+2, TILE-4, TILE-4))
-            elif char == "=":
-                # Brick
-                pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+1, y+1, 6, 6))
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+9, y+1, 6, 6))
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+1, y+9, 6, 6))
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+9, y+9, 6, 6))
-            elif char == "?":
-                # Question block
-                pygame.draw.rect(surf, NES_PALETTE[35], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[33], (draw_x+2, y+2, TILE-4, TILE-4))
-                pygame.draw.rect(surf, NES_PALETTE[39], (draw_x+5, y+4, 6, 3))
-                pygame.draw.rect(surf, NES_PALETTE[39], (draw_x+8, y+7, 3, 3))
-                pygame.draw.rect(surf, NES_PALETTE[39], (draw_x+6, y+10, 4, 2))
-            elif char == "U":
-                # Used block
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[0], (draw_x+2, y+2, TILE-4, TILE-4))
-            elif char == "T":
-                # Pipe top
-                pygame.draw.rect(surf, NES_PALETTE[14], (draw_x-2, y, TILE+4, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[37], (draw_x, y+2, 4, TILE-2))
-                pygame.draw.rect(surf, NES_PALETTE[0], (draw_x+TILE-2, y+2, 2, TILE-2))
-            elif char == "t":
-                # Pipe body
-                pygame.draw.rect(surf, NES_PALETTE[14], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[37], (draw_x+2, y, 4, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[0], (draw_x+TILE-2, y, 2, TILE))
-            elif char == "L":
-                # Flag pole
-                pygame.draw.rect(surf, NES_PALETTE[14], (draw_x+6, y, 4, TILE*6))
-                pygame.draw.rect(surf, NES_PALETTE[37], (draw_x+7, y, 2, TILE*6))
-                # Flag
-                pygame.draw.polygon(surf, NES_PALETTE[14], [
-                    (draw_x+10, y+8), (draw_x+26, y+16), (draw_x+10, y+24)
-                ])
-                # Ball on top
-                pygame.draw.circle(surf, NES_PALETTE[14], (draw_x+8, y-4), 6)
-            elif char == "C":
-                # Castle
-                pygame.draw.rect(surf, NES_PALETTE[0], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[28], (draw_x+2, y+2, TILE-4, TILE-4))
-            elif char == "b":
-                # Bridge
-                pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, 8))
-                pygame.draw.rect(surf, NES_PALETTE[21], (draw_x+2, y+2, TILE-4, 4))
-            elif char == "A":
-                # Lava
-                pygame.draw.rect(surf, NES_PALETTE[22], (draw_x, y, TILE, TILE))
-                pygame.draw.rect(surf, NES_PALETTE[33], (draw_x+2, y+2, TILE-4, TILE-4))
-                # Animated bubbles
-                bubble_y = y + 4 + int(math.sin(pygame.time.get_ticks()/200 + x) * 3)
-                pygame.draw.circle(surf, NES_PALETTE[35], (draw_x+8, bubble_y), 3)
-            elif char == "X":
-                # Axe
-                pygame.draw.rect(surf, NES_PALETTE[35], (draw_x+4, y+2, 8, 12))
-                pygame.draw.rect(surf, NES_PALETTE[33], (draw_x+6, y+4, 4, 8))
-                pygame.draw.polygon(surf, NES_PALETTE[28], [
-                    (draw_x+2, y+4), (draw_x+6, y+2), (draw_x+6, y+10), (draw_x+2, y+8)
-                ])
+        # Tiles sit on whole pixels so baked and immediate rendering agree
+        cam = math.ceil(cam)
+        if self.baked:
+            self.draw_baked(surf, cam)
+            return
+        for x, y, char in self.tiles_between(cam - TILE - TILE_OVERHANG, cam + WIDTH + TILE_OVERHANG):
+            self.draw_tile(surf, x, y, char, x - cam)
+    def chunk(self, index):
+        # Static tiles of one column strip, rendered on first use
+        surf = self.chunks.get(index)
+        if surf is None:
+            surf = self.render_chunk(index)
+            counters.add("tiles.chunks_baked")
+            surf.set_colorkey(BAKE_KEY, RLEACCEL)
+            self.chunks[index] = surf
+        return surf
+    def render_chunk(self, index):
+        chunk_w = CHUNK_TILES * TILE
+        left = index * chunk_w
+        surf = pygame.Surface((chunk_w, HEIGHT))
+        surf.fill(BAKE_KEY)
+        # Neighbouring tiles are drawn too, clipped, for art that overhangs the strip
+        for x, y, char in self.tiles_between(left - TILE - TILE_OVERHANG, left + chunk_w + TILE_OVERHANG):
+            if char not in ANIMATED_TILES:
+                self.draw_tile(surf, x, y, char, x - left)
+        return surf
+    def draw_baked(self, surf, cam):
+        chunk_w = CHUNK_TILES * TILE
+        first = max(cam // chunk_w, 0)
+        last = min((cam + WIDTH) // chunk_w, (self.width - 1) // chunk_w)
+        # Only strips next to the view stay resident
+        for index in list(self.chunks):
+            if index < first - 1 or index > last + 1:
+                del self.chunks[index]
+        for index in range(first, last + 1):
+            surf.blit(self.chunk(index), (index * chunk_w - cam, 0))
+            counters.add("draw.blits")
+        if not self.animated:
+            return
+        for x, y, char in self.tiles_between(cam - TILE, cam + WIDTH):
+            if char in self.animated:
+                self.draw_tile(surf, x, y, char, x - cam)
+    def tile_frame(self, x, y, char):
+        # Lava bubbles bob with time; every other tile has a single look
+        if char == "A":
+            return int(math.sin(pygame.time.get_ticks()/200 + x) * 3)
+        return 0
+    def draw_tile(self, surf, x, y, char, draw_x):
+        sprite, ox, oy = tile_sprites.get(self.world, char, self.tile_frame(x, y, char))
+        if sprite is not None:
+            surf.blit(sprite, (draw_x + ox, y + oy))
+            counters.add("draw.blits")
+
+def compile_level(level_data, level_id):
+    """What TileMap and LevelScene derive from a level's rows, as plain data that marshals"""
+    solid, start = [], None
+    for y, row in enumerate(level_data):
+        for x, char in enumerate(row):
+            if char in ("#", "=", "P", "T", "t", "?", "U", "C", "b"):
+                solid.append((x, y))
+            if char == "S":
+                start = (x * TILE, y * TILE)
+    compiled = {
+        "rows": list(level_data),
+        "solid": solid,
+        "colliders": [(tuple(rect), covered) for rect, covered in greedy_rects(solid)],
+        "spawns": spawn_table(level_data),
+        "start": start,  # player position, else Player's default
+    }
+    return compiled
+
+# What a compiled level read back from the cache must hold
+COMPILED_KEYS = {"rows", "solid", "colliders", "spawns", "start"}
+
+# Compiled levels are only reused by the engine source and pygame build that wrote them
+with open(os.path.abspath(__file__), "rb") as source:
+    ENGINE_VERSION = hashlib.sha1(source.read() + pygame.version.ver.encode()).hexdigest()
+
+def keeps_level(level_id):
+    # Worth a cache file: the level is hand-built, or the seed it was generated from will be used again
+    return LEVEL_SEED_PINNED or level_id in ("1-1", "8-4")
+
+def cached_level(level_data, level_id, keep=None):
+    """compile_level() output for a level, read from LEVEL_CACHE_DIR; compiled, and stored there if kept, on a miss"""
+    if not (keeps_level(level_id) if keep is None else keep):
+        counters.add("levels.compiled")
+        return compile_level(level_data, level_id)
+    world = level_id.split("-")[0]
+    key = hashlib.sha1("\n".join([world, *level_data]).encode()).hexdigest()
+    path = os.path.join(LEVEL_CACHE_DIR, f"{ENGINE_VERSION}-{key}.level")
+    try:
+        with open(path, "rb") as f:
+            compiled = marshal.loads(f.read())  # one read; marshal.load(f) reads object by object
+        if not isinstance(compiled, dict) or compiled.keys() != COMPILED_KEYS:
+            raise ValueError(f"{path} is not a compiled level")
+        os.utime(path)  # recently used, so pruned last
+        counters.add("levels.cache_hits")
+        return compiled
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # Truncated, corrupt or foreign: a miss, and the file is replaced below
+        remove_file(path)
+    compiled = compile_level(level_data, level_id)
+    counters.add("levels.compiled")
+    try:
+        os.makedirs(LEVEL_CACHE_DIR, exist_ok=True)
+        # Written aside and renamed into place, so readers and parallel compilers never see half a file
+        temp = f"{path}.{os.getpid()}"
+        with open(temp, "wb") as f:
+            marshal.dump(compiled, f)
+        os.replace(temp, path)
+        prune_level_cache()
+    except OSError:
+        pass  # read-only install: levels are compiled on every load instead
+    return compiled
+
+def prune_level_cache():
+    # Delete files other engine versions wrote, then the least recently used until the rest fit LEVEL_CACHE_BYTES
+    entries = []
+    for entry in os.scandir(LEVEL_CACHE_DIR):
+        if not entry.name.startswith(ENGINE_VERSION):
+            remove_file(entry.path)
+        elif entry.name.endswith(".level"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= LEVEL_CACHE_BYTES:
+            break
+        remove_file(path)
+        total -= size
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # already gone, or not ours to delete
+
+def compile_job(job):
+    # compile_levels() pool worker; whether to keep the level comes with the job, as a spawned
+    # worker re-imports the module with a fresh, unpinned seed
+    level_id, level_data, keep = job
+    cached_level(level_data, level_id, keep)
+    return level_id, keep
+
+def compile_levels(workers=None):
+    # Fill the level cache for every level of the current seed, one process per core by default
+    jobs = [(level_id, LEVELS[level_id], keeps_level(level_id)) for level_id in LEVELS]
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        done = list(pool.imap_unordered(compile_job, jobs))
+    kept = sum(keep for level_id, keep in done)
+    print(f"{len(done)} levels compiled, {kept} kept in {LEVEL_CACHE_DIR}, {time.perf_counter() - start:.2f} s")
 
 class TitleScreen(Scene):
     def __init__(self):
@@ -618,30 +1807,25 @@ class TitleScreen(Scene):
         pygame.draw.rect(surf, NES_PALETTE[33], (box_x+8, box_y+8, box_width-16, box_height-16))
         
         # "Cat's !" text
-        cat_font = pygame.font.SysFont(None, 28)
-        cat_text = cat_font.render("Cat's !", True, NES_PALETTE[39])
+        cat_text = text_cache.render("Cat's !", 28, NES_PALETTE[39])
         surf.blit(cat_text, (box_x + 20, box_y + 15))
         
         # Main title
-        title_font = pygame.font.SysFont(None, 36)
-        title = title_font.render("KOOPA ENGINE", True, NES_PALETTE[39])
+        title = text_cache.render("KOOPA ENGINE", 36, NES_PALETTE[39])
         surf.blit(title, (box_x + (box_width - title.get_width()) // 2, box_y + 45))
         
         # HDR 1.0
-        hdr_font = pygame.font.SysFont(None, 32)
-        hdr = hdr_font.render("HDR 1.0", True, NES_PALETTE[35])
+        hdr = text_cache.render("HDR 1.0", 32, NES_PALETTE[35])
         surf.blit(hdr, (box_x + (box_width - hdr.get_width()) // 2, box_y + 80))
         
         # Subtitle
-        sub_font = pygame.font.SysFont(None, 16)
-        sub = sub_font.render("~ 8 Worlds Adventure ~", True, NES_PALETTE[21])
+        sub = text_cache.render("~ 8 Worlds Adventure ~", 16, NES_PALETTE[21])
         surf.blit(sub, (box_x + (box_width - sub.get_width()) // 2, box_y + 110))
         
         # Copyright
-        copy_font = pygame.font.SysFont(None, 14)
-        copy1 = copy_font.render("[C] 2024 Team Flames / Samsoft", True, NES_PALETTE[28])
+        copy1 = text_cache.render("[C] 2024 Team Flames / Samsoft", 14, NES_PALETTE[28])
         surf.blit(copy1, (WIDTH//2 - copy1.get_width()//2, box_y + box_height + 15))
-        copy2 = copy_font.render("Licensed by Nintendo", True, NES_PALETTE[28])
+        copy2 = text_cache.render("Licensed by Nintendo", 14, NES_PALETTE[28])
         surf.blit(copy2, (WIDTH//2 - copy2.get_width()//2, box_y + box_height + 30))
         
         # Characters at bottom
@@ -683,8 +1867,7 @@ class TitleScreen(Scene):
         # Press Enter
         if self.logo_y >= self.logo_target_y:
             if int(self.timer * 10) % 2 == 0:
-                font = pygame.font.SysFont(None, 24)
-                text = font.render("PRESS ENTER TO START", True, NES_PALETTE[39])
+                text = text_cache.render("PRESS ENTER TO START", 24, NES_PALETTE[39])
                 surf.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT - 30))
 
 class FileSelect(Scene):
@@ -703,13 +1886,12 @@ class FileSelect(Scene):
                     state.world = state.progress[state.slot]["world"]
                     push(WorldMapScene())
                 elif e.key == K_ESCAPE:
-                    push(TitleScreen())
+                    pop()
     def update(self, dt):
         self.offset += dt
     def draw(self, s):
         s.fill(NES_PALETTE[0])
-        font = pygame.font.SysFont(None, 36)
-        title = font.render("SELECT FILE", True, NES_PALETTE[39])
+        title = text_cache.render("SELECT FILE", 36, NES_PALETTE[39])
         s.blit(title, (WIDTH//2 - title.get_width()//2, 30))
         for i in range(3):
             x = 60 + i * 150
@@ -720,8 +1902,7 @@ class FileSelect(Scene):
             if i == self.selected:
                 pygame.draw.rect(s, NES_PALETTE[35], (x-8, y-8, 106, 146), 3)
             # File number
-            slot_font = pygame.font.SysFont(None, 28)
-            slot_text = slot_font.render(f"FILE {i+1}", True, NES_PALETTE[39])
+            slot_text = text_cache.render(f"FILE {i+1}", 28, NES_PALETTE[39])
             s.blit(slot_text, (x + 45 - slot_text.get_width()//2, y+10))
             # Mario icon
             pygame.draw.rect(s, NES_PALETTE[33], (x+38, y+40, 14, 20))
@@ -729,21 +1910,22 @@ class FileSelect(Scene):
             # World progress
             if state.progress[i]:
                 world = state.progress[i]["world"]
-                world_font = pygame.font.SysFont(None, 20)
-                world_text = world_font.render(f"WORLD {world}", True, NES_PALETTE[39])
+                world_text = text_cache.render(f"WORLD {world}", 20, NES_PALETTE[39])
                 s.blit(world_text, (x+45 - world_text.get_width()//2, y+70))
-                thumb = THUMBNAILS.get(f"{world}-1", THUMBNAILS["1-1"])
+                thumb = THUMBNAILS.get(f"{world}-1") or THUMBNAILS["1-1"]
                 scaled_thumb = pygame.transform.scale(thumb, (64, 48))
                 s.blit(scaled_thumb, (x+13, y+85))
         # Instructions
-        inst_font = pygame.font.SysFont(None, 18)
-        inst = inst_font.render("LEFT/RIGHT: Select   ENTER: Start   ESC: Back", True, NES_PALETTE[28])
+        inst = text_cache.render("LEFT/RIGHT: Select   ENTER: Start   ESC: Back", 18, NES_PALETTE[28])
         s.blit(inst, (WIDTH//2 - inst.get_width()//2, HEIGHT - 40))
 
 class WorldMapScene(Scene):
     def __init__(self):
         self.selection = state.world
         self.cursor_timer = 0
+    def enter(self):
+        # Back from a level: put the cursor on the world that was played
+        self.selection = state.world
     def handle(self, evts, keys):
         for e in evts:
             if e.type == KEYDOWN:
@@ -761,13 +1943,12 @@ class WorldMapScene(Scene):
                         state.progress[state.slot]["world"] = self.selection
                         push(LevelScene(f"{state.world}-1"))
                 elif e.key == K_ESCAPE:
-                    push(FileSelect())
+                    pop()
     def update(self, dt):
         self.cursor_timer += dt
     def draw(self, s):
         s.fill(NES_PALETTE[1])
-        font = pygame.font.SysFont(None, 36)
-        title = font.render("WORLD SELECT", True, NES_PALETTE[39])
+        title = text_cache.render("WORLD SELECT", 36, NES_PALETTE[39])
         s.blit(title, (WIDTH//2 - title.get_width()//2, 20))
         world_size = 60
         for world in range(1, 9):
@@ -780,8 +1961,7 @@ class WorldMapScene(Scene):
                 pygame.draw.rect(s, NES_PALETTE[theme["ground"]], (x, y, world_size, world_size))
                 pygame.draw.rect(s, NES_PALETTE[theme["sky"]], (x+5, y+5, world_size-10, world_size-10))
                 # World number
-                w_font = pygame.font.SysFont(None, 32)
-                w_text = w_font.render(f"{world}", True, NES_PALETTE[39])
+                w_text = text_cache.render(f"{world}", 32, NES_PALETTE[39])
                 s.blit(w_text, (x + world_size//2 - w_text.get_width()//2, y + world_size//2 - w_text.get_height()//2))
             else:
                 pygame.draw.rect(s, NES_PALETTE[0], (x, y, world_size, world_size))
@@ -789,8 +1969,7 @@ class WorldMapScene(Scene):
                 pygame.draw.line(s, NES_PALETTE[33], (x, y), (x+world_size, y+world_size), 3)
                 pygame.draw.line(s, NES_PALETTE[33], (x+world_size, y), (x, y+world_size), 3)
             if world == self.selection:
-                name_font = pygame.font.SysFont(None, 20)
-                name_text = name_font.render(theme["name"], True, NES_PALETTE[35])
+                name_text = text_cache.render(theme["name"], 20, NES_PALETTE[35])
                 s.blit(name_text, (WIDTH//2 - name_text.get_width()//2, HEIGHT - 60))
         # Cursor
         row = (self.selection - 1) // 4
@@ -806,17 +1985,19 @@ class WorldMapScene(Scene):
         pygame.draw.rect(s, NES_PALETTE[33], (mario_x+4, mario_y+8, 8, 8))
         pygame.draw.rect(s, NES_PALETTE[39], (mario_x+4, mario_y, 8, 8))
         # Instructions
-        font = pygame.font.SysFont(None, 16)
-        text = font.render("Arrows: Move   ENTER: Play   ESC: Back", True, NES_PALETTE[28])
+        text = text_cache.render("Arrows: Move   ENTER: Play   ESC: Back", 16, NES_PALETTE[28])
         s.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT - 25))
-        unlocked = font.render(f"Progress: World {max(state.unlocked_worlds)}/8", True, NES_PALETTE[28])
+        unlocked = text_cache.render(f"Progress: World {max(state.unlocked_worlds)}/8", 16, NES_PALETTE[28])
         s.blit(unlocked, (10, HEIGHT - 25))
 
 class LevelScene(Scene):
     def __init__(self, level_id):
-        self.map = TileMap(LEVELS[level_id], level_id)
+        level = cached_level(LEVELS[level_id], level_id)
+        self.map = TileMap(LEVELS[level_id], level_id, level)
         self.player = Player(50, 200)
-        self.enemies = []
+        # Enemies add themselves to the store as they spawn; self.enemies is its list of them
+        self.store = EntityStore()
+        self.enemies = self.store.views
         self.cam = 0.0
         self.level_id = level_id
         self.time = 400
@@ -825,31 +2006,61 @@ class LevelScene(Scene):
         self.end_timer = 0
         world = int(level_id.split("-")[0])
         self.theme = WORLD_THEMES[world]
-        for y, row in enumerate(LEVELS[level_id]):
-            for x, char in enumerate(row):
-                if char == "S":
-                    self.player.x = x * TILE
-                    self.player.y = y * TILE
-                elif char == "E":
-                    self.enemies.append(Goomba(x * TILE, y * TILE))
-                elif char == "K":
-                    self.enemies.append(Koopa(x * TILE, y * TILE))
-                elif char == "F":
-                    self.enemies.append(Fish(x * TILE, y * TILE))
-                elif char == "H":
-                    self.enemies.append(Spike(x * TILE, y * TILE))
-                elif char == "B":
-                    self.enemies.append(Bowser(x * TILE, y * TILE))
+        if level["start"] is not None:
+            self.player.x, self.player.y = level["start"]
+        self.spawns = level["spawns"]
+        self.next_spawn = 0  # first spawn table entry not created yet
+        self.ticks = 0  # simulation steps so far, for LOD scheduling
+        self.stream_enemies()
+        self.snapshot()
+    def snapshot(self):
+        # Positions before the next step; draw() blends from these toward the current state
+        self.prev_cam = self.cam
+        self.player.prev_x, self.player.prev_y = self.player.x, self.player.y
+        self.store.snapshot()
+    def stream_enemies(self):
+        # SMB1-style spawning: create enemies as the camera nears their column, release those far behind
+        # or fallen below the map
+        reach = (self.cam + WIDTH + SPAWN_AHEAD) // TILE
+        while self.next_spawn < len(self.spawns) and self.spawns[self.next_spawn][0] <= reach:
+            x, y, char = self.spawns[self.next_spawn]
+            self.store.spawn(ENEMY_KINDS[char], x * TILE, y * TILE)
+            self.next_spawn += 1
+            counters.add("entities.spawned")
+        counters.add("entities.released", self.store.release_behind(self.cam - DESPAWN_BEHIND))
+        counters.add("entities.released", self.store.release_below(self.map.height))
+        counters.add("entities.compacted", self.store.release_dead())
+    def dispose(self):
+        # A finished level keeps nothing alive: map, chunks and enemies go with it
+        self.map.dispose()
+        self.store.clear()
     def handle(self, evts, keys):
         for e in evts:
             if e.type == KEYDOWN and e.key == K_ESCAPE:
-                push(WorldMapScene())
+                pop_to(WorldMapScene)
     def update(self, dt):
+        self.snapshot()
+        self.stream_enemies()
         self.time -= dt
-        self.player.update(self.map.colliders, dt, self.enemies)
-        for enemy in self.enemies:
-            if enemy.active:
-                enemy.update(self.map.colliders, dt)
+        self.player.update(self.map, dt, self.store)
+        # Off-screen enemies sleep or, with LOD_EVERY > 1, catch up every few steps
+        full, reduced = self.store.schedule(self.cam, self.cam + WIDTH, self.ticks)
+        self.ticks += 1
+        if BATCH_ENEMIES and np is not None:
+            active = self.store.step(self.map, dt, full)
+            lod = self.store.step(self.map, dt * LOD_EVERY, reduced)
+        else:
+            active = lod = 0
+            for enemy in self.enemies:
+                if enemy.active and full[enemy.slot]:
+                    enemy.update(self.map, dt)
+                    active += 1
+                elif enemy.active and reduced[enemy.slot]:
+                    enemy.update(self.map, dt * LOD_EVERY)
+                    lod += 1
+        counters.add("entities.active", active)
+        counters.add("entities.lod", lod)
+        counters.add("entities.inactive", len(self.enemies) - active - lod)
         target = self.player.x - WIDTH // 2
         self.cam += (target - self.cam) * 0.1
         self.cam = max(0, min(self.cam, self.map.width - WIDTH))
@@ -864,54 +2075,54 @@ class LevelScene(Scene):
                 level = int(level)
                 if level < 4:
                     next_level = f"{world}-{level+1}"
-                    push(LevelScene(next_level))
+                    replace(LevelScene(next_level))
                 else:
                     if world < 8 and (world + 1) not in state.unlocked_worlds:
                         state.unlocked_worlds.append(world + 1)
                     if world == 8 and level == 4:
-                        push(WinScreen())
+                        replace(WinScreen())
                     else:
-                        push(WorldMapScene())
+                        pop_to(WorldMapScene)
         # Fall death
         if self.player.y > HEIGHT + 50:
             state.lives -= 1
             if state.lives <= 0:
-                push(GameOverScene())
+                reset_to(GameOverScene())
             else:
                 self.player.x = 50
                 self.player.y = 200
                 self.player.vx = 0
                 self.player.vy = 0
                 self.cam = 0
+                self.snapshot()  # respawn is a jump, not a move
     def draw(self, s):
-        self.map.draw(s, self.cam)
-        for enemy in self.enemies:
-            enemy.draw(s, self.cam)
-        self.player.draw(s, self.cam)
+        cam = self.prev_cam + (self.cam - self.prev_cam) * self.alpha
+        self.map.draw(s, cam)
+        for enemy in self.store.visible(cam, cam + WIDTH):
+            enemy.draw(s, cam, self.alpha)
+        self.player.draw(s, cam, self.alpha)
         # HUD
         pygame.draw.rect(s, NES_PALETTE[0], (0, 0, WIDTH, 32))
-        font = pygame.font.SysFont(None, 20)
         # Mario
         pygame.draw.rect(s, NES_PALETTE[33], (10, 8, 10, 14))
         pygame.draw.rect(s, NES_PALETTE[39], (10, 4, 10, 6))
-        lives_text = font.render(f"x {state.lives}", True, NES_PALETTE[39])
+        lives_text = text_cache.render(f"x {state.lives}", 20, NES_PALETTE[39])
         s.blit(lives_text, (25, 10))
         # Score
-        score_text = font.render(f"SCORE: {state.score:06d}", True, NES_PALETTE[39])
+        score_text = text_cache.render(f"SCORE: {state.score:06d}", 20, NES_PALETTE[39])
         s.blit(score_text, (80, 10))
         # Coins
         pygame.draw.circle(s, NES_PALETTE[35], (210, 16), 6)
-        coin_text = font.render(f"x {state.coins:02d}", True, NES_PALETTE[39])
+        coin_text = text_cache.render(f"x {state.coins:02d}", 20, NES_PALETTE[39])
         s.blit(coin_text, (220, 10))
         # World
-        world_text = font.render(f"WORLD {self.level_id}", True, NES_PALETTE[39])
+        world_text = text_cache.render(f"WORLD {self.level_id}", 20, NES_PALETTE[39])
         s.blit(world_text, (300, 10))
         # Time
-        time_text = font.render(f"TIME: {int(max(0, self.time)):03d}", True, NES_PALETTE[39])
+        time_text = text_cache.render(f"TIME: {int(max(0, self.time)):03d}", 20, NES_PALETTE[39])
         s.blit(time_text, (420, 10))
         # Level name
-        name_font = pygame.font.SysFont(None, 16)
-        name_text = name_font.render(self.theme["name"], True, NES_PALETTE[28])
+        name_text = text_cache.render(self.theme["name"], 16, NES_PALETTE[28])
         s.blit(name_text, (WIDTH - name_text.get_width() - 10, 10))
 
 class GameOverScene(Scene):
@@ -922,14 +2133,12 @@ class GameOverScene(Scene):
         if self.timer <= 0:
             state.lives = 3
             state.score = 0
-            push(TitleScreen())
+            reset_to(TitleScreen())
     def draw(self, s):
         s.fill(NES_PALETTE[0])
-        font = pygame.font.SysFont(None, 48)
-        text = font.render("GAME OVER", True, NES_PALETTE[33])
+        text = text_cache.render("GAME OVER", 48, NES_PALETTE[33])
         s.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - 40))
-        font2 = pygame.font.SysFont(None, 24)
-        score_text = font2.render(f"Final Score: {state.score}", True, NES_PALETTE[39])
+        score_text = text_cache.render(f"Final Score: {state.score}", 24, NES_PALETTE[39])
         s.blit(score_text, (WIDTH//2 - score_text.get_width()//2, HEIGHT//2 + 20))
 
 class WinScreen(Scene):
@@ -967,51 +2176,408 @@ class WinScreen(Scene):
                 if p["life"] <= 0:
                     fw["particles"].remove(p)
         if self.timer <= 0:
-            push(TitleScreen())
+            reset_to(TitleScreen())
     def draw(self, s):
         s.fill(NES_PALETTE[0])
         for fw in self.fireworks:
             pygame.draw.circle(s, NES_PALETTE[35], (int(fw["x"]), int(fw["y"])), 4)
             for p in fw["particles"]:
                 pygame.draw.circle(s, fw["color"], (int(p["x"]), int(p["y"])), 3)
-        font = pygame.font.SysFont(None, 48)
-        text = font.render("CONGRATULATIONS!", True, NES_PALETTE[35])
+        text = text_cache.render("CONGRATULATIONS!", 48, NES_PALETTE[35])
         s.blit(text, (WIDTH//2 - text.get_width()//2, 60))
-        font2 = pygame.font.SysFont(None, 32)
-        text2 = font2.render("YOU DEFEATED BOWSER!", True, NES_PALETTE[39])
+        text2 = text_cache.render("YOU DEFEATED BOWSER!", 32, NES_PALETTE[39])
         s.blit(text2, (WIDTH//2 - text2.get_width()//2, 120))
-        text3 = font2.render("PEACE RETURNS TO THE MUSHROOM KINGDOM", True, NES_PALETTE[37])
+        text3 = text_cache.render("PEACE RETURNS TO THE MUSHROOM KINGDOM", 32, NES_PALETTE[37])
         s.blit(text3, (WIDTH//2 - text3.get_width()//2, 160))
-        font3 = pygame.font.SysFont(None, 28)
-        score = font3.render(f"FINAL SCORE: {state.score}", True, NES_PALETTE[33])
+        score = text_cache.render(f"FINAL SCORE: {state.score}", 28, NES_PALETTE[33])
         s.blit(score, (WIDTH//2 - score.get_width()//2, 220))
         # Thank you message
-        thanks = pygame.font.SysFont(None, 20)
-        ty = thanks.render("THANK YOU FOR PLAYING!", True, NES_PALETTE[28])
+        ty = text_cache.render("THANK YOU FOR PLAYING!", 20, NES_PALETTE[28])
         s.blit(ty, (WIDTH//2 - ty.get_width()//2, 280))
         # Credits
-        cred = thanks.render("Cat's ! Koopa Engine HDR 1.0 - Team Flames / Samsoft", True, NES_PALETTE[28])
+        cred = text_cache.render("Cat's ! Koopa Engine HDR 1.0 - Team Flames / Samsoft", 20, NES_PALETTE[28])
         s.blit(cred, (WIDTH//2 - cred.get_width()//2, HEIGHT - 40))
 
+class LinearColliders:
+    """TileMap stand-in that tests every rect of a list, like the old Entity.update scan"""
+    def __init__(self, colliders):
+        self.colliders = colliders
+    def sweep_box(self, x, y, w, h, dx, dy):
+        # Nearest face ahead among all colliders
+        d = dx or dy
+        lo, size, side, span = (x, w, y, h) if dx else (y, h, x, w)
+        best = None
+        for rect in self.colliders:
+            near, far, edge0, edge1 = (rect.left, rect.right, rect.top, rect.bottom) if dx else (rect.top, rect.bottom, rect.left, rect.right)
+            if edge1 <= side or edge0 >= side + span:
+                continue
+            if d > 0 and lo + size <= near < lo + size + d and (best is None or near - size < best):
+                best = near - size
+            elif d < 0 and lo + d < far <= lo and (best is None or far > best):
+                best = far
+        return (lo + d, False) if best is None else (best, True)
+    def solid_at(self, x, y):
+        return pygame.Rect(x, y, 1, 1).collidelist(self.colliders) != -1
+
+def bench_collision(frames=600):
+    # Per-frame collision cost of the player and every enemy: the original scan over one rect per
+    # solid tile, the same scan over merged colliders, and the tile grid
+    print(f"{'level':<6}{'solid':>7}{'colliders':>10}{'tile ms':>10}{'merged ms':>10}{'grid ms':>10}{'speedup':>9}")
+    for level_id in LEVELS:
+        results = []
+        for mode in ("tiles", "merged", "grid"):
+            scene = LevelScene(level_id)
+            # Every enemy of the level at once, not only those streamed in near the start
+            for x, y, char in scene.spawns[scene.next_spawn:]:
+                scene.store.spawn(ENEMY_KINDS[char], x * TILE, y * TILE)
+            scene.next_spawn = len(scene.spawns)
+            if mode == "tiles":
+                tiles = LinearColliders([rect for row in scene.map.grid for rect in row if rect is not None])
+            elif mode == "merged":
+                tiles = LinearColliders(scene.map.colliders)
+            else:
+                tiles = scene.map
+            start = time.perf_counter()
+            for _ in range(frames):
+                Entity.update(scene.player, tiles, SIM_DT)
+                for enemy in scene.enemies:
+                    if enemy.active:
+                        enemy.update(tiles, SIM_DT)
+            results.append((time.perf_counter() - start) * 1000 / frames)
+        per_tile, merged, grid = results
+        print(f"{level_id:<6}{len(scene.map.cell_collider):>7}{len(scene.map.colliders):>10}{per_tile:>10.3f}{merged:>10.3f}{grid:>10.3f}{per_tile / grid:>8.1f}x")
+
+def bench_entities(count=5000, frames=120):
+    # Walking enemies on a long flat level, one update() each vs. EntityStore.step(); both must agree
+    if np is None:
+        print("numpy is not installed: enemies update one by one")
+        return False
+    # Ground with a pit every 64 columns to turn at and a two-tile wall every 97 to bump into
+    cols = count // 2 + 64
+    ground = "".join(" " if i % 64 in (40, 41) else "#" for i in range(cols))
+    wall = "".join("#" if i % 97 == 96 else " " for i in range(cols))
+    tiles = TileMap([" " * cols] * 10 + [wall, wall, ground, ground], "1-1")
+    kinds = (Goomba,) * 12 + (Koopa, Fish, Spike, Bowser)
+    results = {}
+    for batch in (False, True):
+        store = EntityStore()
+        for i in range(count):
+            kinds[i % len(kinds)]((i // 2 + 1) * TILE + i % 2 * 5, 9 * TILE, store)
+        start = time.perf_counter()
+        for _ in range(frames):
+            store.snapshot()
+            if batch:
+                store.step(tiles, SIM_DT)
+            else:
+                for enemy in store.views:
+                    if enemy.active:
+                        enemy.update(tiles, SIM_DT)
+        elapsed = (time.perf_counter() - start) * 1000 / frames
+        results[batch] = (elapsed, {name: column[:count].copy() for name, column in store.columns.items()})
+    (slow, before), (fast, after) = results[False], results[True]
+    same = all(np.array_equal(before[name], after[name]) for name in before)
+    print(f"{count} enemies, {frames} frames: update() {slow:.3f} ms/frame, step() {fast:.3f} ms/frame ({slow / fast:.1f}x)")
+    print(f"step() fits {1000 / SIM_HZ / fast:.1f}x into a {SIM_HZ} Hz frame; final states {'match' if same else 'DIFFER'}")
+    return same
+
+def bench_broadphase(sizes=(10, 100, 1000, 10000)):
+    # Contact tests per tick as enemies grow: every enemy (and every pair) vs. the sorted sweep
+    if np is None:
+        print("numpy is not installed: contacts scan every enemy")
+        return
+    rng = random.Random(1)
+    print(f"{'enemies':>8}{'player scan':>13}{'sweep':>9}{'pairs scan':>12}{'sweep':>9}{'hits':>6}  (ms per tick)")
+    for count in sizes:
+        store = EntityStore()
+        for i in range(count):
+            Goomba(rng.uniform(0, count * 24), rng.uniform(0, HEIGHT - TILE), store)
+        player = Player(count * 12, HEIGHT // 2)
+        movers = list(range(0, count, 100))  # one enemy in a hundred looks for enemy contact
+        repeats = max(1, 1000 // count)
+        timings = []
+        for scan in (True, False):
+            gc.collect()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                candidates = store.views if scan else store.touching(player)
+                hits = [enemy for enemy in candidates if enemy.active and player.check_collision(enemy)]
+            timings.append((time.perf_counter() - start) * 1000 / repeats)
+            gc.collect()
+            start = time.perf_counter()
+            if scan:
+                pairs = ((store.views[row], other) for row in movers for other in store.views if other is not store.views[row])
+            else:
+                pairs = store.pairs(movers)
+            touches = [(a, b) for a, b in pairs if b.active and a.check_collision(b)]
+            timings.append((time.perf_counter() - start) * 1000)
+            if scan:
+                expected = (hits, touches)
+        assert expected == (hits, touches), "sweep missed a contact"
+        player_scan, pairs_scan, player_sweep, pairs_sweep = timings
+        print(f"{count:>8}{player_scan:>13.3f}{player_sweep:>9.3f}{pairs_scan:>12.3f}{pairs_sweep:>9.3f}{len(hits) + len(touches):>6}")
+
+def bench_tiles(widths=(200, 2000, 20000), frames=300):
+    # Tile drawing as levels get longer: only visible columns are walked, so the cost stays flat
+    surf = pygame.Surface((WIDTH, HEIGHT))
+    source = LEVELS["1-1"]
+    print(f"{'columns':>8}{'tiles':>9}{'scan ms':>9}{'draw ms':>9}{'baked ms':>10}  (per frame)")
+    for columns in widths:
+        rows = [(row * (columns // len(row) + 1))[:columns] for row in source]
+        tiles = TileMap(rows, "1-1")
+        everything = list(tiles.tiles_between(0, tiles.width))
+        start_cam = (tiles.width - WIDTH) // 2
+        timings = []
+        # What the old per-tile loop did every frame: cull every tile of the level
+        gc.collect()
+        start = time.perf_counter()
+        for i in range(frames):
+            cam = start_cam + i * 2
+            visible = [t for t in everything if -TILE - TILE_OVERHANG <= t[0] - cam <= WIDTH + TILE_OVERHANG]
+        timings.append((time.perf_counter() - start) * 1000 / frames)
+        for baked in (False, True):
+            tiles.baked = baked
+            gc.collect()
+            start = time.perf_counter()
+            for i in range(frames):
+                tiles.draw(surf, start_cam + i * 2)
+            timings.append((time.perf_counter() - start) * 1000 / frames)
+        tiles.dispose()
+        scan, draw, baked = timings
+        print(f"{columns:>8}{len(everything):>9}{scan:>9.3f}{draw:>9.3f}{baked:>10.3f}")
+
+def bench_destroy(removals=300):
+    # Breaking solid tiles: cost per remove_solid(), then collision and pixels must match a map built without them
+    source = LEVELS["1-1"]
+    tiles = TileMap(source, "1-1")
+    cells = random.Random(1).sample(sorted(tiles.cell_collider), min(removals, len(tiles.cell_collider)))
+    surf, expected = pygame.Surface((WIDTH, HEIGHT)), pygame.Surface((WIDTH, HEIGHT))
+    # Bake every strip first so the removals have chunks to invalidate
+    for strip in range((tiles.width - 1) // (CHUNK_TILES * TILE) + 1):
+        tiles.chunk(strip)
+    start = time.perf_counter()
+    for tx, ty in cells:
+        tiles.remove_solid(tx, ty)
+    elapsed = (time.perf_counter() - start) * 1000 / len(cells)
+    rows = [list(row) for row in source]
+    for tx, ty in cells:
+        rows[ty][tx] = " "
+    fresh = TileMap(["".join(row) for row in rows], "1-1")
+    collision = (tiles.grid == fresh.grid and sorted(tiles.cell_collider) == sorted(fresh.cell_collider)
+                 and not any(tiles.solid_at(tx * TILE, ty * TILE) for tx, ty in cells)
+                 and (tiles.solid is None or (tiles.solid == fresh.solid).all()))
+    pixels = True
+    for baked in (False, True):
+        tiles.baked = fresh.baked = baked
+        for cam in range(0, tiles.width - WIDTH, TILE * 7):
+            tiles.draw(surf, cam)
+            fresh.draw(expected, cam)
+            pixels &= pygame.image.tobytes(surf, "RGB") == pygame.image.tobytes(expected, "RGB")
+    print(f"{len(cells)} solid tiles removed: {elapsed:.3f} ms each, {len(tiles.colliders)} colliders left ({len(fresh.colliders)} when built without them)")
+    print(f"collision {'matches' if collision else 'DIFFERS'}, pixels {'match' if pixels else 'DIFFER'}")
+    return collision and pixels
+
+def bench_scenes(transitions=1000):
+    # Level transitions must not leak: finished levels are released, so memory stays flat
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()  # Player.update reads the keyboard
+    surf = pygame.Surface((WIDTH, HEIGHT))
+    levels = list(LEVELS)
+    reset_to(TitleScreen())
+    push(FileSelect())
+    push(WorldMapScene())
+    collect_scenes()
+    samples = {}
+    tracemalloc.start()
+    for i in range(transitions):
+        if not isinstance(SCENES[-1], LevelScene):
+            pop_to(WorldMapScene)  # skip the win screen like a player would
+            push(LevelScene(levels[i % len(levels)]))
+        scene = SCENES[-1]
+        scene.update(SIM_DT)
+        scene.draw(surf)
+        # Finish the level now and let it pick its own next scene
+        scene.end_level, scene.end_timer = True, 0
+        scene.update(SIM_DT)
+        collect_scenes()
+        if i + 1 in (transitions // 10, transitions):
+            del scene  # the only reference to a level that was just replaced
+            gc.collect()
+            maps = sum(isinstance(o, TileMap) for o in gc.get_objects())
+            samples[i + 1] = (tracemalloc.get_traced_memory()[0], len(SCENES), maps)
+    tracemalloc.stop()
+    print(f"{'transitions':>11}{'traced KB':>11}{'stack':>7}{'live maps':>11}")
+    for n, (mem, depth, maps) in samples.items():
+        print(f"{n:>11}{mem / 1024:>11.1f}{depth:>7}{maps:>11}")
+    (early, _, _), (late, depth, maps) = samples.values()
+    flat = late - early < 256 * 1024 and depth <= 4 and maps <= 1
+    print("memory flat" if flat else "memory GROWING")
+    return flat
+
+def run_headless(level_id="1-1", frames=10000, script=run_right, render=False, inputs=None):
+    # Step a LevelScene as fast as it goes: dummy video driver, scripted keys, no frame cap
+    global controls
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+    surf = pygame.Surface((WIDTH, HEIGHT)) if render else None
+    controls = inputs or ScriptedInput(script)
+    reset_to(LevelScene(level_id))
+    steps = 0
+    start = time.perf_counter()
+    # Runs until the frame budget is spent or play leaves the levels (game over, world cleared)
+    while steps < frames and isinstance(SCENES[-1], LevelScene):
+        scene = SCENES[-1]
+        scene.update(SIM_DT)
+        controls.advance()
+        if surf is not None:
+            scene.draw(surf)
+        counters.end_frame()
+        collect_scenes()
+        steps += 1
+    elapsed = time.perf_counter() - start
+    print(f"{level_id}: {steps} frames in {elapsed:.3f} s = {steps / elapsed:.0f} sim fps (render: {'offscreen' if render else 'none'})")
+    return steps / elapsed
+
+def pack_levels(path):
+    # Write this seed's levels to a pack and report how small it came out
+    levels = generate_level_data(LEVEL_SEED)
+    grids = save_level_pack(path, {LEVEL_SEED: levels})
+    text = sum(len(row) for rows in levels.values() for row in rows)
+    print(f"{path}: {len(levels)} levels in {grids} distinct grids, {os.path.getsize(path)} bytes (row strings: {text} chars)")
+
+def pregenerate_job(seed):
+    # pregenerate() pool worker: one seed's levels, packed
+    return seed, [(level_id, pack_level(generate_level(seed, level_id))) for level_id in LEVEL_IDS]
+
+def pregenerate(path, count, workers=None):
+    # Levels of seeds 0..count-1 generated across a process pool (one process per core by default) into one pack
+    start = time.perf_counter()
+    levels = []
+    with multiprocessing.Pool(workers) as pool:
+        for seed, packed in pool.imap(pregenerate_job, range(count), chunksize=16):
+            levels.extend((seed, level_id, level) for level_id, level in packed)
+    grids = write_level_pack(path, levels)
+    print(f"{path}: {count} seeds, {len(levels)} levels in {grids} distinct grids, {os.path.getsize(path)} bytes, {time.perf_counter() - start:.2f} s")
+
+def run_replay(path, render=False):
+    # Play a recording back headless through the same update path and check it still matches
+    with open(path) as f:
+        replay = json.load(f)
+    if replay["sim_hz"] != SIM_HZ:
+        raise ValueError(f"{path} was recorded at {replay['sim_hz']} Hz, simulation runs at {SIM_HZ} Hz")
+    # Rebuild levels from the recorded seed as they are reached
+    global LEVEL_SEED, LEVEL_SEED_PINNED
+    LEVEL_SEED, LEVEL_SEED_PINNED = replay["seed"], True
+    LEVELS.clear()
+    THUMBNAILS.clear()
+    state.__init__()
+    source = ReplayInput(replay)
+    run_headless(replay["level"], replay["frames"], render=render, inputs=source)
+    match = source.digest.hexdigest() == replay["digest"]
+    print(f"replay {'matches' if match else 'DIVERGES from'} the recording ({source.step}/{replay['frames']} frames)")
+    return match
+
+def arg_value(name, default):
+    # Value following name on the command line, e.g. --frames 5000
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+def main(first=TitleScreen):
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Cat's ! Koopa Engine HDR 1.0")
+    clock = pygame.time.Clock()
+    push(first())
+
+    accumulator = 0.0
+    while SCENES:
+        accumulator += clock.tick(FPS) / 1000
+        stamps = [time.perf_counter()]
+        events = pygame.event.get()
+        for e in events:
+            if e.type == QUIT:
+                pygame.quit()
+                sys.exit()
+            elif e.type == KEYDOWN and e.key == PROFILER_KEY:
+                profiler.visible = not profiler.visible
+            elif e.type == KEYDOWN and e.key == SAMPLER_KEY:
+                sampler.start(SAMPLE_SECONDS, "profile.folded")
+        stamps.append(time.perf_counter())
+        SCENES[-1].handle(events, controls.pressed())
+        stamps.append(time.perf_counter())
+        # Whole SIM_DT steps only; a long hitch runs MAX_SIM_STEPS and drops the rest
+        steps = 0
+        while SCENES and accumulator >= SIM_DT:
+            if steps == MAX_SIM_STEPS:
+                accumulator %= SIM_DT
+                break
+            SCENES[-1].update(SIM_DT)
+            controls.advance()
+            accumulator -= SIM_DT
+            steps += 1
+        stamps.append(time.perf_counter())
+        if not SCENES:
+            break
+        scene = SCENES[-1]
+        scene.alpha = accumulator / SIM_DT
+        scene.draw(screen)
+        profiler.draw(screen)
+        stamps.append(time.perf_counter())
+        pygame.display.flip()
+        stamps.append(time.perf_counter())
+        profiler.record(stamps)
+        counters.end_frame()
+        collect_scenes()
+
+    pygame.quit()
+
 # Main
-pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Cat's ! Koopa Engine HDR 1.0")
-clock = pygame.time.Clock()
-push(TitleScreen())
-
-while SCENES:
-    dt = clock.tick(FPS) / 1000
-    events = pygame.event.get()
-    for e in events:
-        if e.type == QUIT:
-            pygame.quit()
-            sys.exit()
-    scene = SCENES[-1]
-    scene.handle(events, pygame.key.get_pressed())
-    scene.update(dt)
-    scene.draw(screen)
-    pygame.display.flip()
-
-pygame.quit()
-sys.exit()
+if __name__ == "__main__":
+    if "--seed" in sys.argv:
+        # --seed N: fixed levels, the same on every machine, instead of a fresh seed per launch
+        LEVEL_SEED, LEVEL_SEED_PINNED = int(arg_value("--seed", 0)), True
+        if not 0 <= LEVEL_SEED < 2 ** 32:
+            raise ValueError(f"--seed {LEVEL_SEED} is outside 0..{2 ** 32 - 1}, the range level packs store")
+    if "--level-pack" in sys.argv:
+        # --level-pack PATH: play levels from a pack written by --pack-levels
+        use_level_pack(arg_value("--level-pack", "levels.pack"))
+    if "--counters" in sys.argv:
+        counters.count_primitives()
+        atexit.register(counters.dump)
+    if "--sample-profile" in sys.argv:
+        # --sample-profile SECONDS [--profile-out PATH]: sample from startup
+        sampler.start(float(arg_value("--sample-profile", SAMPLE_SECONDS)), arg_value("--profile-out", "profile.folded"))
+    if "--bench-collision" in sys.argv:
+        bench_collision()
+    elif "--bench-entities" in sys.argv:
+        sys.exit(0 if bench_entities(int(arg_value("--bench-entities", 5000))) else 1)
+    elif "--bench-broadphase" in sys.argv:
+        bench_broadphase()
+    elif "--bench-tiles" in sys.argv:
+        bench_tiles()
+    elif "--bench-destroy" in sys.argv:
+        sys.exit(0 if bench_destroy() else 1)
+    elif "--bench-scenes" in sys.argv:
+        sys.exit(0 if bench_scenes() else 1)
+    elif "--compile-levels" in sys.argv:
+        # --compile-levels [WORKERS]: fill the level cache, by default with a process per core
+        compile_levels(int(arg_value("--compile-levels", 0)) or None)
+    elif "--pregenerate" in sys.argv:
+        # --pregenerate COUNT [--workers N] [--pack-out PATH]: seeds 0..COUNT-1 into one level pack
+        pregenerate(arg_value("--pack-out", "levels.pack"), int(arg_value("--pregenerate", 1000)), int(arg_value("--workers", 0)) or None)
+    elif "--pack-levels" in sys.argv:
+        pack_levels(arg_value("--pack-levels", "levels.pack"))
+    elif "--replay" in sys.argv:
+        sys.exit(0 if run_replay(arg_value("--replay", "session.replay"), "--render" in sys.argv) else 1)
+    elif "--record" in sys.argv:
+        # Play one level with the keyboard and save what was pressed
+        controls = RecordingInput(arg_value("--level", "1-1"), LEVEL_SEED)
+        try:
+            main(lambda: LevelScene(controls.level_id))
+        finally:
+            controls.save(arg_value("--record", "session.replay"))
+    elif "--headless" in sys.argv:
+        run_headless(arg_value("--level", "1-1"), int(arg_value("--frames", 10000)), render="--render" in sys.argv)
+    else:
+        main()
+    sys.exit()
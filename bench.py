@@ -0,0 +1,157 @@
+"""Headless benchmark across every level of every engine.
+
+    python bench.py [--frames 600] [--engine koopa1.py] [--replay run.replay] [--out report.json] [--counters]
+
+Each engine runs in its own process so peak RSS is per engine. Per level, a
+scripted run (or the given recording) is played through LevelScene, timing the
+update, draw and flip phases of every frame separately. Engine work counters are
+reported per frame; --counters adds pygame.draw primitive counts, whose wrappers
+slow the draw phase, so leave it off for timing runs.
+"""
+import os
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+import sys
+import json
+import time
+import platform
+import subprocess
+import importlib.util
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENGINES = ["CATS_KOOPA_ENGINE_HDR_1.py", "koopa1.py", "koopahdr.py"]
+PHASES = ("update", "draw", "flip", "frame")
+
+def arg_value(name, default):
+    # Value following name on the command line, e.g. --frames 600
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+def load_engine(path):
+    # Engines only run their window loop as __main__, so importing one is side-effect free
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    engine = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(engine)
+    return engine
+
+def percentiles(samples):
+    # Nearest-rank p50/p95/p99 in milliseconds
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0
+    return {"p50": round(pick(0.50), 4), "p95": round(pick(0.95), 4), "p99": round(pick(0.99), 4)}
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+def bench_level(engine, screen, level_id, frames, replay=None):
+    # One level: fresh game state, scripted or recorded keys, phase timings per frame
+    engine.state.__init__()
+    if replay is not None:
+        engine.controls = engine.ReplayInput(replay)
+    else:
+        engine.state.lives = frames  # scripted runs die a lot; keep playing to the frame budget
+        engine.controls = engine.ScriptedInput(engine.run_right)
+    engine.reset_to(engine.LevelScene(level_id))
+    times = {phase: [] for phase in PHASES}
+    clock = time.perf_counter
+    for _ in range(frames):
+        if not isinstance(engine.SCENES[-1], engine.LevelScene):
+            break  # world cleared
+        t0 = clock()
+        engine.SCENES[-1].update(engine.SIM_DT)
+        engine.controls.advance()
+        t1 = clock()
+        engine.SCENES[-1].draw(screen)
+        t2 = clock()
+        engine.pygame.display.flip()
+        t3 = clock()
+        engine.counters.end_frame()
+        engine.collect_scenes()
+        times["update"].append(t1 - t0)
+        times["draw"].append(t2 - t1)
+        times["flip"].append(t3 - t2)
+        times["frame"].append(t3 - t0)
+    return times
+
+def bench_engine(path, frames, replay_path=None):
+    engine = load_engine(path)
+    engine.pygame.init()
+    screen = engine.pygame.display.set_mode((engine.WIDTH, engine.HEIGHT))
+    if "--counters" in sys.argv:
+        engine.counters.count_primitives()
+    replay = None
+    levels = list(engine.LEVELS)
+    if replay_path:
+        with open(replay_path) as f:
+            replay = json.load(f)
+        if replay["sim_hz"] != engine.SIM_HZ:
+            raise ValueError(f"{replay_path} was recorded at {replay['sim_hz']} Hz, {path} runs at {engine.SIM_HZ} Hz")
+        # Levels come from the seed the replay was recorded with; only the replayed one gets built
+        engine.LEVEL_SEED = replay["seed"]
+        engine.LEVELS.clear()
+        levels, frames = [replay["level"]], replay["frames"]
+    report = {"engine": os.path.basename(path), "input": "replay" if replay else "scripted", "levels": {}}
+    totals = {phase: [] for phase in PHASES}
+    for level_id in levels:
+        engine.counters.reset()
+        times = bench_level(engine, screen, level_id, frames, replay)
+        report["levels"][level_id] = {"frames": len(times["frame"]), **{p: percentiles(times[p]) for p in PHASES},
+                                      "counters": {name: row["per_frame"] for name, row in engine.counters.report().items()}}
+        for phase in PHASES:
+            totals[phase] += times[phase]
+    report["total"] = {"frames": len(totals["frame"]), **{p: percentiles(totals[p]) for p in PHASES}}
+    if replay:
+        # A run that drifted from the recording timed different play; say so rather than report it silently
+        report["replay_matches"] = engine.controls.digest.hexdigest() == replay["digest"]
+    report["peak_rss_kb"] = peak_rss_kb()
+    engine.pygame.quit()
+    return report
+
+def main():
+    frames = int(arg_value("--frames", 600))
+    replay = arg_value("--replay", None)
+    engines = [arg_value("--engine", None)] if "--engine" in sys.argv else ENGINES
+    if "--child" in sys.argv:
+        # Worker process: one engine, JSON on stdout
+        print(json.dumps(bench_engine(os.path.join(ROOT, engines[0]), frames, replay)))
+        return
+    import pygame
+    report = {"python": platform.python_version(), "pygame": pygame.version.ver,
+              "platform": platform.platform(), "frames_per_level": frames, "engines": []}
+    for name in engines:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", "--engine", name, "--frames", str(frames)]
+        if replay:
+            cmd += ["--replay", replay]
+        if "--counters" in sys.argv:
+            cmd.append("--counters")
+        start = time.perf_counter()
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        result["wall_s"] = round(time.perf_counter() - start, 2)
+        total = result["total"]
+        print(f"{name:<28} frames {total['frames']:>6}  frame p50 {total['frame']['p50']:.3f} ms"
+              f"  p99 {total['frame']['p99']:.3f} ms  peak RSS {result['peak_rss_kb']} KB", file=sys.stderr)
+        if result.get("replay_matches") is False:
+            print(f"{name:<28} replay does NOT match the recording", file=sys.stderr)
+        report["engines"].append(result)
+    text = json.dumps(report, indent=2)
+    out_path = arg_value("--out", None)
+    if out_path:
+        with open(out_path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if any(result.get("replay_matches") is False for result in report["engines"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()